@@ -312,6 +312,8 @@ class Proj5GUI( QMainWindow ):
 		
 		if results:
 			self.statusBar.showMessage('')
+			if results.get('solver'):
+				self.statusBar.showMessage('Solved by {}'.format(results['solver']))
 			self.numSolutions.setText( '{}'.format(results['count']) )
 			self.tourCost.setText( '{}'.format(results['cost']) )
 			self.solvedIn.setText( '{:6.6f} seconds'.format(results['time']) )
@@ -376,7 +378,13 @@ class Proj5GUI( QMainWindow ):
 		('Default                            ','defaultRandomTour'), \
 		('Greedy','greedy'), \
 		('Branch and Bound','branchAndBound'), \
-		('Fancy','fancy') \
+		('Fancy','fancy'), \
+		('Hilbert Curve','hilbertTour'), \
+		('Cheapest Insertion','cheapestInsertionTour'), \
+		('Farthest Insertion','farthestInsertionTour'), \
+		('Portfolio','portfolio'), \
+		('Decomposition','decomposition'), \
+		('Multi-Start','multiStart') \
 	]															# whitespace hack to get longest to display correctly
 
 	def initUI( self ):
@@ -5,6 +5,7 @@ import math
 import numpy as np
 import random
 import time
+import hashlib
 
 
 
@@ -23,6 +24,34 @@ class TSPSolution:
 		cost += self.route[-1].costTo( self.route[0] )
 		return cost
 
+	''' <summary>
+		Cost of many tours at once. routes is a (k, n) array whose rows are permutations of
+		the city indices 0..n-1, and cost is the scenario's cost matrix (see
+		Scenario.getCostMatrix). All k*n edges are gathered from the matrix in one go, so
+		this is far quicker than making a TSPSolution of City objects for each row.
+		</summary>
+		<returns>float array of the k tour costs, inf for tours that use a missing edge</returns> '''
+	@staticmethod
+	def costOfRoutes( cost, routes ):
+		routes = np.asarray( routes )
+		ncities = len(cost)
+		if routes.ndim != 2 or routes.shape[1] != ncities:
+			raise ValueError( 'routes must be a (k, {}) array, got shape {}'.format(ncities, routes.shape) )
+		if not np.issubdtype( routes.dtype, np.integer ):
+			raise ValueError( 'routes must hold integer city indices' )
+		bad = np.flatnonzero( np.any(np.sort(routes, axis=1) != np.arange(ncities), axis=1) )
+		if len(bad) > 0:
+			raise ValueError( 'rows {} are not permutations of 0..{}'.format([int(b) for b in bad[:10]], ncities-1) )
+
+		edges = np.asarray( cost[routes, np.roll(routes, -1, axis=1)] )
+		if np.issubdtype( edges.dtype, np.integer ):
+			missing = np.any( edges == NO_EDGE, axis=1 )
+			# int32 edges summed as int64, so long tours cannot wrap around
+			costs = edges.sum( axis=1, dtype=np.int64 ).astype( float )
+			costs[missing] = np.inf
+			return costs
+		return edges.sum( axis=1 )
+
 	def enumerateEdges( self ):
 		elist = []
 		c1 = self.route[0]
@@ -39,6 +68,54 @@ class TSPSolution:
 		return elist
 
 
+NO_EDGE = np.iinfo(np.int32).max # the integer cost of an edge that does not exist
+
+
+def toFloat( costs ):
+	# integer costs as floats, with inf for NO_EDGE (float costs come back as they are)
+	costs = np.asarray( costs )
+	if not np.issubdtype( costs.dtype, np.integer ):
+		return costs
+	out = costs.astype( float )
+	out[costs == NO_EDGE] = np.inf
+	return float(out) if out.ndim == 0 else out
+
+
+''' <summary>
+	A float view of an integer cost matrix: indexing it gathers the entries like numpy
+	does, but as floats with inf for missing edges. Solvers that do arithmetic on costs
+	read through this, so the matrix itself can stay int32 (see Scenario.getCostMatrix).
+	</summary> '''
+class FloatCosts:
+	def __init__( self, matrix ):
+		self.matrix = matrix
+		self.shape = matrix.shape
+
+	def __getitem__( self, key ):
+		return toFloat( self.matrix[key] )
+
+	def __len__( self ):
+		return len(self.matrix)
+
+
+def floatView( cost ):
+	# cost as something that indexes to floats (see FloatCosts)
+	dtype = cost.dtype if hasattr( cost, 'dtype' ) else np.asarray( cost ).dtype
+	if isinstance( cost, FloatCosts ) or not np.issubdtype( dtype, np.integer ):
+		return cost
+	return FloatCosts( cost )
+
+
+def tourCost( cost, route ):
+	# cost of the tour route (city indices) from an integer cost matrix, inf if an edge is
+	# missing. The int32 entries are summed as int64, so long tours cannot wrap around
+	route = np.asarray( route )
+	edges = cost[route, np.roll(route, -1)]
+	if np.any( edges == NO_EDGE ):
+		return math.inf
+	return int( edges.sum(dtype=np.int64) )
+
+
 def nameForInt( num ):
 	if num == 0:
 		return ''
@@ -57,33 +134,39 @@ def nameForInt( num ):
 class Scenario:
 
 	HARD_MODE_FRACTION_TO_REMOVE = 0.20 # Remove 20% of the edges
+	IMPLICIT_EDGES_ABOVE = 5000 # cities; bigger scenarios use HashedEdges instead of a matrix
+	SPARSE_ABOVE = 0.9 # removing more than this fraction of the edges keeps them as SparseEdges
 
-	def __init__( self, city_locations, difficulty, rand_seed ):
+	def __init__( self, city_locations, difficulty, rand_seed, implicitEdges=None, fractionToRemove=None ):
 		self._difficulty = difficulty
-
+		# the fraction of the edges Hard modes remove
+		self._fractionToRemove = self.HARD_MODE_FRACTION_TO_REMOVE if fractionToRemove is None else fractionToRemove
+
+		# The cities are stored as columns (see _cityArrays); City objects are only views
+		# of them, made when getCities is called
+		self._xs = np.array( [pt.x() for pt in city_locations], dtype=float )
+		self._ys = np.array( [pt.y() for pt in city_locations], dtype=float )
+		ncities = len(self._xs)
 		if difficulty == "Normal" or difficulty == "Hard":
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+			self._es = np.array( [random.uniform(0.0,1.0) for _ in range(ncities)] )
 		elif difficulty == "Hard (Deterministic)":
 			random.seed( rand_seed )
-			self._cities = [City( pt.x(), pt.y(), \
-								  random.uniform(0.0,1.0) \
-								) for pt in city_locations]
+			self._es = np.array( [random.uniform(0.0,1.0) for _ in range(ncities)] )
 		else:
-			self._cities = [City( pt.x(), pt.y() ) for pt in city_locations]
-
-
-		num = 0
-		for city in self._cities:
-			#if difficulty == "Hard":
-			city.setScenario(self)
-			city.setIndexAndName( num, nameForInt( num+1 ) )
-			num += 1
+			self._es = np.zeros( ncities )
+		self._cities = None
 
 		# Assume all edges exists except self-edges
-		ncities = len(self._cities)
-		self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		if implicitEdges is None:
+			implicitEdges = ncities > self.IMPLICIT_EDGES_ABOVE
+		if implicitEdges:
+			self._edge_exists = HashedEdges( ncities )
+		elif difficulty in ("Hard", "Hard (Deterministic)") and self._fractionToRemove > self.SPARSE_ABOVE:
+			self._edge_exists = None # thinEdges picks the edges that stay (see SparseEdges)
+		else:
+			self._edge_exists = ( np.ones((ncities,ncities)) - np.diag( np.ones((ncities)) ) ) > 0
+		self._cost = None # built on demand by getCostMatrix
+		self._candidates = {} # by k, built on demand by getCandidates
 
 		if difficulty == "Hard":
 			self.thinEdges()
@@ -91,8 +174,224 @@ class Scenario:
 			self.thinEdges(deterministic=True)
 
 	def getCities( self ):
+		if self._cities is None:
+			self._cities = [City( self, i ) for i in range(len(self._xs))]
 		return self._cities
 
+	def getCityName( self, index ):
+		# names are only made when they are asked for (the GUI labels)
+		return nameForInt( index+1 )
+
+
+	''' <summary>
+		The full cost matrix of the scenario (entry [i,j] is cities[i].costTo(cities[j])),
+		computed all at once with numpy and then cached. applyDelta keeps it up to date.
+		Costs are int32, with NO_EDGE where costTo would give inf, which takes half the
+		memory of floats. Use floatView (or toFloat) to do arithmetic with them. When the
+		edges are SparseEdges, this is a SparseCosts that only holds the costs of the edges.
+		</summary> '''
+	def getCostMatrix( self ):
+		if self._cost is None:
+			if isinstance( self._edge_exists, SparseEdges ):
+				edges = self._edge_exists
+				self._cost = SparseCosts( edges, self._costPairs(edges.keys // edges.n, edges.indices) )
+			else:
+				self._cost = self._costBlock( np.arange(len(self._xs)), np.arange(len(self._xs)) )
+		return self._cost
+
+
+	''' <summary>
+		Whether the scenario is too big for its edges to be kept as a matrix (see
+		IMPLICIT_EDGES_ABOVE and HashedEdges). getCostMatrix would still build all n^2 costs
+		for it, so solvers should get by with getCandidates and _costBlock instead.
+		</summary> '''
+	def hasImplicitEdges( self ):
+		return isinstance( self._edge_exists, HashedEdges )
+
+
+	''' <summary>
+		The graph as CSR adjacency: the edges out of city i go to indices[indptr[i]:indptr[i+1]]
+		(in increasing order) and cost costs[indptr[i]:indptr[i+1]]. For SparseEdges these
+		are the arrays the scenario keeps; otherwise they are gathered from every row.
+		</summary>
+		<returns>(indptr, indices, costs)</returns> '''
+	def getAdjacency( self ):
+		cost = self.getCostMatrix()
+		if isinstance( cost, SparseCosts ):
+			return cost.indptr, cost.indices, cost.values
+		rows = [np.flatnonzero( self._edge_exists[i] ) for i in range(len(self._xs))]
+		indptr = np.concatenate( ([0], np.cumsum([len(r) for r in rows])) )
+		indices = np.concatenate( rows ).astype( np.int32 ) if rows else np.empty( 0, dtype=np.int32 )
+		src = np.repeat( np.arange(len(self._xs)), np.diff(indptr) )
+		return indptr, indices, np.asarray( cost[src, indices] )
+
+	''' <summary>
+		A digest of the scenario's costs (and so of which edges exist) as a hex string. Two
+		scenarios with the same fingerprint are the same problem, which is what saved search
+		state (see TSPSolver.resumeBranchAndBound) is checked against.
+		</summary> '''
+	def fingerprint( self ):
+		cost = self.getCostMatrix()
+		digest = hashlib.sha256( np.array(cost.shape, dtype=np.int64).tobytes() )
+		if isinstance( cost, SparseCosts ):
+			parts = ( cost.indptr, cost.indices, cost.values )
+		else:
+			parts = ( cost, )
+		for part in parts:
+			digest.update( np.ascontiguousarray(part).tobytes() )
+		return digest.hexdigest()
+
+	def _cityArrays( self ):
+		# x, y and elevation of every city as numpy arrays
+		return self._xs, self._ys, self._es
+
+	def _costBlock( self, rows, cols ):
+		# vectorized version of City.costTo for every pair in rows x cols
+		cost = self._costPairs( np.asarray(rows)[:,None], np.asarray(cols)[None,:] )
+		cost[~self._edge_exists[np.ix_(rows, cols)]] = NO_EDGE
+		return cost
+
+	def _costPairs( self, src, dst ):
+		# what City.costTo would give for src[k] -> dst[k] if the edge existed (src and dst
+		# broadcast against each other)
+		xs, ys, es = self._cityArrays()
+		cost = np.sqrt( (xs[dst] - xs[src])**2 + (ys[dst] - ys[src])**2 )
+		if not self._difficulty == 'Easy':
+			cost += es[dst] - es[src]
+			cost[cost < 0.0] = 0.0
+		cost = np.ceil( cost * City.MAP_SCALE )
+		if cost.size > 0 and cost.max() >= NO_EDGE:
+			raise OverflowError( 'edge costs do not fit in 32 bits' )
+		return cost.astype( np.int32 )
+
+
+	''' <summary>
+		The k cheapest outgoing edges of every city, as an (n, k) int32 array of city indices
+		sorted by cost (ties go to the nearer city). Rows are padded with -1 when a city has
+		fewer than k edges. The index is cached per k.
+
+		It is built from a grid over the map: for each city we look at the cells in rings
+		around its own until we have k candidates and nothing outside the rings searched can
+		be cheaper. Because of the elevation term, that bound is the ring's distance minus
+		the biggest possible drop in elevation. Each city only looks at a few cells, so this
+		is far from the n^2 it takes to scan the whole cost matrix.
+		</summary> '''
+	def getCandidates( self, k=8 ):
+		if k in self._candidates:
+			return self._candidates[k]
+		xs, ys, es = self._cityArrays()
+		ncities = len(self._xs)
+		candidates = np.full( (ncities, k), -1, dtype=np.int32 )
+		if ncities == 0:
+			return candidates
+
+		# about two cities per cell
+		side = max( 1, int(math.ceil(math.sqrt(ncities / 2.0))) )
+		xmin, ymin = xs.min(), ys.min()
+		size = max( xs.max() - xmin, ys.max() - ymin, 1e-12 ) / side
+		cx = np.minimum( ((xs - xmin) / size).astype(int), side-1 )
+		cy = np.minimum( ((ys - ymin) / size).astype(int), side-1 )
+		cell = cx * side + cy
+		# the cities of cell c are byCell[start[c]:start[c+1]]
+		byCell = np.argsort( cell, kind='stable' )
+		start = np.searchsorted( cell[byCell], np.arange(side*side + 1) )
+		lowest = es.min() if not self._difficulty == 'Easy' else 0.0
+
+		for i in range(ncities):
+			found = np.empty( 0, dtype=int )
+			foundCost = np.empty( 0 )
+			ring = 0
+			while True:
+				# the cells at exactly this (Chebyshev) distance from our cell
+				cells = []
+				for gx in range( max(0, cx[i]-ring), min(side, cx[i]+ring+1) ):
+					if abs(gx - cx[i]) == ring:
+						gys = range( max(0, cy[i]-ring), min(side, cy[i]+ring+1) )
+					else:
+						gys = [g for g in (cy[i]-ring, cy[i]+ring) if 0 <= g < side]
+					for gy in gys:
+						c = gx * side + gy
+						if start[c] < start[c+1]:
+							cells.append( byCell[start[c]:start[c+1]] )
+				if cells:
+					near = np.concatenate( cells )
+					near = near[self._edge_exists[i, near]]
+					found = np.concatenate( (found, near) )
+					foundCost = np.concatenate( (foundCost, self._costBlock( np.array([i]), near )[0]) )
+					if len(found) > k:
+						# the rings go outward, so a stable sort leaves the nearer city first on ties
+						keep = np.argsort( foundCost, kind='stable' )[:k]
+						keep.sort()
+						found, foundCost = found[keep], foundCost[keep]
+				# nothing outside these rings is closer than ring*size
+				bound = math.ceil( max(0.0, ring*size + lowest - es[i]) * City.MAP_SCALE )
+				if (len(found) == k and bound >= foundCost.max()) or ring >= side:
+					break
+				ring += 1
+			order = np.argsort( foundCost, kind='stable' )
+			candidates[i, :len(found)] = found[order]
+
+		self._candidates[k] = candidates
+		return candidates
+
+
+	''' <summary>
+		Apply a small change (see ScenarioDelta) to this scenario in place. Edges are toggled
+		first (using the old indices), then cities are removed, then the new cities are added
+		to the end. Only the affected rows/cols of the cached cost matrix are recomputed.
+		</summary>
+		<returns>array mapping each old city index to its new index (-1 if removed)</returns> '''
+	def applyDelta( self, delta ):
+		if isinstance( self._edge_exists, SparseEdges ):
+			# the costs of a sparse graph go with its edges, so they are made again after
+			self._cost = None
+		for src, dst in delta.toggledEdges:
+			if src == dst:
+				continue # self-edges never exist
+			self._edge_exists[src,dst] = not self._edge_exists[src,dst]
+			if self._cost is not None:
+				self._cost[src,dst] = self._costBlock( np.array([src]), np.array([dst]) )[0,0]
+
+		ncities = len(self._xs)
+		remap = np.full( ncities, -1, dtype=int )
+		removed = set( delta.removedCities )
+		keep = [i for i in range(ncities) if i not in removed]
+		remap[keep] = np.arange( len(keep) )
+		if removed:
+			self._xs, self._ys, self._es = self._xs[keep], self._ys[keep], self._es[keep]
+			if isinstance( self._edge_exists, (HashedEdges, SparseEdges) ):
+				self._edge_exists.keepOnly( keep )
+			else:
+				self._edge_exists = self._edge_exists[np.ix_(keep, keep)]
+			if self._cost is not None:
+				self._cost = self._cost[np.ix_(keep, keep)]
+
+		if delta.addedCities:
+			nold = len(self._xs)
+			self._xs = np.concatenate( (self._xs, [loc[0] for loc in delta.addedCities]) )
+			self._ys = np.concatenate( (self._ys, [loc[1] for loc in delta.addedCities]) )
+			self._es = np.concatenate( (self._es, [loc[2] if len(loc) > 2 else 0.0 for loc in delta.addedCities]) )
+			nnew = len(self._xs)
+			# new cities are connected to everything
+			if isinstance( self._edge_exists, (HashedEdges, SparseEdges) ):
+				self._edge_exists.grow( nnew - nold )
+			else:
+				grown = np.ones( (nnew,nnew), dtype=bool )
+				grown[:nold,:nold] = self._edge_exists
+				np.fill_diagonal( grown, False )
+				self._edge_exists = grown
+			if self._cost is not None:
+				grownCost = np.empty( (nnew,nnew), dtype=np.int32 )
+				grownCost[:nold,:nold] = self._cost
+				added = np.arange( nold, nnew )
+				grownCost[nold:,:] = self._costBlock( added, np.arange(nnew) )
+				grownCost[:nold,nold:] = self._costBlock( np.arange(nold), added )
+				self._cost = grownCost
+
+		self._candidates = {}
+		self._cities = None # the views are made again, with the new indices
+		return remap
+
 
 	def randperm( self, n ):				#isn't there a numpy function that does this and even gets called in Solver?
 		perm = np.arange(n)
@@ -104,16 +403,38 @@ class Scenario:
 		return perm
 
 	def thinEdges( self, deterministic=False ):
-		ncities = len(self._cities)
+		ncities = len(self._xs)
 		edge_count = ncities*(ncities-1) # can't have self-edge
-		num_to_remove = np.floor(self.HARD_MODE_FRACTION_TO_REMOVE*edge_count)
-
-		can_delete	= self._edge_exists.copy()
+		num_to_remove = np.floor(self._fractionToRemove*edge_count)
 
 		# Set aside a route to ensure at least one tour exists
 		route_keep = np.random.permutation( ncities )
 		if deterministic:
 			route_keep = self.randperm( ncities )
+
+		if isinstance( self._edge_exists, HashedEdges ):
+			# about the same fraction goes, picked by the hash instead of one at a time
+			seed = random.getrandbits( 64 ) if deterministic else int( np.random.randint(2**62) )
+			self._edge_exists.thin( self._fractionToRemove, route_keep, seed )
+			return
+
+		if self._edge_exists is None:
+			# pick the edges that stay instead: about the right number out of each city
+			# (duplicates are dropped), plus the kept route
+			seed = random.getrandbits( 64 ) if deterministic else int( np.random.randint(2**62) )
+			rng = np.random.default_rng( seed )
+			stay = rng.binomial( ncities-1, 1.0-self._fractionToRemove, size=ncities )
+			src = np.repeat( np.arange(ncities), stay )
+			dst = rng.integers( 0, max(ncities-1, 1), size=len(src) )
+			dst[dst >= src] += 1 # never to itself
+			src = np.concatenate( (src, route_keep) )
+			dst = np.concatenate( (dst, np.roll(route_keep, -1)) )
+			real = src != dst
+			self._edge_exists = SparseEdges( ncities, src[real], dst[real] )
+			self._cost = None
+			return
+
+		can_delete	= self._edge_exists.copy()
 		for i in range(ncities):
 			can_delete[route_keep[i],route_keep[(i+1)%ncities]] = False
 
@@ -132,21 +453,260 @@ class Scenario:
 
 
 
+''' <summary>
+	A small change to a scenario between runs: cities added (as (x, y) or (x, y, elevation)
+	tuples), cities removed (by index) and edges toggled on or off (as (src, dst) index pairs).
+	</summary> '''
+class ScenarioDelta:
+	def __init__( self, addedCities=(), removedCities=(), toggledEdges=() ):
+		self.addedCities = list(addedCities)
+		self.removedCities = list(removedCities)
+		self.toggledEdges = list(toggledEdges)
+
+
+
+
+def matrixIndex( key, n ):
+	# the row and column indices (as arrays which broadcast to the result) that key picks
+	# out of an n x n matrix, for classes which stand in for one. Slices and boolean masks
+	# become index arrays, and a slice goes across the other index like it would in numpy.
+	# A single index out of range raises IndexError, which is also how np.asarray and
+	# iteration find the end of a row
+	if not isinstance( key, tuple ):
+		key = ( key, slice(None) )
+	def positions( index ):
+		if isinstance( index, slice ):
+			return np.arange( n )[index]
+		index = np.asarray( index )
+		if index.dtype == bool:
+			return np.flatnonzero( index )
+		if index.ndim == 0 and not -n <= index < n:
+			raise IndexError( 'index {} is out of bounds for {} cities'.format(int(index), n) )
+		return index
+	rows, cols = positions( key[0] ), positions( key[1] )
+	if isinstance( key[0], slice ) and cols.ndim > 0:
+		rows = rows[:,None]
+	elif isinstance( key[1], slice ) and rows.ndim > 0:
+		cols = cols[None,:]
+	return rows, cols
+
+
+''' <summary>
+	Edge existence for big scenarios without an n x n matrix. Whether src->dst exists is a
+	seeded hash of the pair, so it comes out the same every time it is asked, except that
+	self-edges never exist and the edges of the kept route (route_keep in thinEdges) always
+	do. That is O(n) memory and O(1) per lookup, and a whole row is one vectorized hash.
+	It indexes like the boolean matrix it stands in for: [i, j], a row [i] or column [:, j],
+	[i, array] and np.ix_ blocks. Cities are hashed by an id rather than their index, so
+	applyDelta can remove and add cities (added cities connect to everything), and toggled
+	edges are remembered as exceptions to the hash.
+	</summary> '''
+class HashedEdges:
+	def __init__( self, ncities ):
+		self.ids = np.arange( ncities, dtype=np.int64 )
+		# these are by id
+		self.keepNext = np.full( ncities, -1, dtype=np.int64 ) # next city on the kept route
+		self.connected = np.zeros( ncities, dtype=bool ) # connected to everything
+		self.fraction = 0.0 # of the edges removed
+		self.seed = 0
+		self.flipped = set() # (src id, dst id) of toggled edges
+		self._flipKeys = np.empty( 0, dtype=np.int64 )
+
+	def thin( self, fraction, route_keep, seed ):
+		# remove about fraction of the edges, but none of the tour route_keep
+		self.fraction = fraction
+		self.seed = seed
+		keep = self.ids[route_keep]
+		self.keepNext[keep] = np.roll( keep, -1 )
+
+	def __len__( self ):
+		return len(self.ids)
+
+	@property
+	def shape( self ):
+		return ( len(self.ids), len(self.ids) )
+
+	def __getitem__( self, key ):
+		rows, cols = matrixIndex( key, len(self.ids) )
+		exists = self._exists( self.ids[rows], self.ids[cols] )
+		return bool(exists) if exists.ndim == 0 else exists
+
+	def __setitem__( self, key, value ):
+		# only single edges can be set (applyDelta toggles them)
+		src, dst = key
+		if self[src, dst] != bool(value):
+			self.flipped ^= { (int(self.ids[src]), int(self.ids[dst])) }
+			self._flipKeys = np.array( [(s << 32) | d for s, d in self.flipped], dtype=np.int64 )
+
+	def keepOnly( self, keep ):
+		# the cities at the indices keep stay, in that order
+		self.ids = self.ids[keep]
+
+	def grow( self, count ):
+		# count new cities at the end, connected to everything
+		first = len(self.keepNext)
+		self.ids = np.concatenate( (self.ids, np.arange(first, first+count)) )
+		self.keepNext = np.concatenate( (self.keepNext, np.full(count, -1)) )
+		self.connected = np.concatenate( (self.connected, np.ones(count, dtype=bool)) )
+
+	def _exists( self, src, dst ):
+		src, dst = np.broadcast_arrays( src, dst )
+		exists = np.ones( src.shape, dtype=bool )
+		if self.fraction > 0:
+			exists = self._uniform( src, dst ) >= self.fraction
+			exists |= self.keepNext[src] == dst
+			exists |= self.connected[src] | self.connected[dst]
+		exists &= src != dst
+		if len(self.flipped) > 0:
+			exists ^= np.isin( (src << 32) | dst, self._flipKeys )
+		return exists
+
+	def _uniform( self, src, dst ):
+		# a number in [0, 1) for each pair, from the splitmix64 finalizer
+		with np.errstate( over='ignore' ):
+			z = (src.astype(np.uint64) << np.uint64(32)) | dst.astype(np.uint64)
+			z ^= np.uint64( self.seed )
+			z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+			z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+			z ^= z >> np.uint64(31)
+		return (z >> np.uint64(11)).astype( float ) / 2.0**53
+
+
+
+
+''' <summary>
+	Edge existence for heavily thinned scenarios, as CSR adjacency: the edges out of city i
+	are indices[indptr[i]:indptr[i+1]], in increasing order. Memory is O(edges), and
+	successors/predecessors give a city's edges without scanning all n targets. Like
+	HashedEdges it indexes like the boolean matrix it stands in for; a lookup is a binary
+	search over the edges' keys (src*n + dst, which are sorted too).
+	</summary> '''
+class SparseEdges:
+	def __init__( self, ncities, src, dst ):
+		self._build( ncities, np.asarray(src, dtype=np.int64) * ncities + np.asarray(dst, dtype=np.int64) )
+
+	def _build( self, ncities, keys ):
+		keys = np.sort( keys )
+		if len(keys) > 0:
+			keys = keys[np.concatenate( ([True], keys[1:] != keys[:-1]) )] # without repeats
+		self.n = ncities
+		self.keys = keys
+		self.indices = (keys % ncities).astype( np.int32 )
+		self.indptr = np.searchsorted( keys, np.arange(ncities+1, dtype=np.int64) * ncities )
+		self._pred = None # transposed, made when predecessors is first called
+
+	def __len__( self ):
+		return self.n
+
+	@property
+	def shape( self ):
+		return ( self.n, self.n )
+
+	def successors( self, i ):
+		return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+	def predecessors( self, i ):
+		if self._pred is None:
+			src = self.keys // self.n
+			order = np.argsort( self.indices, kind='stable' )
+			self._pred = ( np.searchsorted(self.indices[order], np.arange(self.n+1)), src[order] )
+		predptr, pred = self._pred
+		return pred[predptr[i]:predptr[i+1]]
+
+	def lookup( self, src, dst ):
+		# where src->dst is in indices (-1 if it is not an edge), for arrays of pairs
+		keys = np.asarray( src, dtype=np.int64 ) * self.n + np.asarray( dst, dtype=np.int64 )
+		if len(self.keys) == 0:
+			return np.full( keys.shape, -1 )
+		pos = np.minimum( np.searchsorted(self.keys, keys), len(self.keys)-1 )
+		return np.where( self.keys[pos] == keys, pos, -1 )
+
+	def __getitem__( self, key ):
+		rows, cols = matrixIndex( key, self.n )
+		exists = self.lookup( rows, cols ) >= 0
+		return bool(exists) if exists.ndim == 0 else exists
+
+	def __setitem__( self, key, value ):
+		# only single edges can be set (applyDelta toggles them)
+		src, dst = key
+		edge = int(src) * self.n + int(dst)
+		if value and not self[src, dst]:
+			self._build( self.n, np.append(self.keys, edge) )
+		elif not value and self[src, dst]:
+			self._build( self.n, self.keys[self.keys != edge] )
+
+	def keepOnly( self, keep ):
+		# the cities at the indices keep stay, in that order
+		remap = np.full( self.n, -1, dtype=np.int64 )
+		remap[keep] = np.arange( len(keep) )
+		src, dst = remap[self.keys // self.n], remap[self.indices]
+		stays = (src >= 0) & (dst >= 0)
+		self._build( len(keep), src[stays] * len(keep) + dst[stays] )
+
+	def grow( self, count ):
+		# count new cities at the end, connected to everything
+		nnew = self.n + count
+		src, dst = self.keys // self.n, self.keys % self.n
+		added = np.arange( self.n, nnew )
+		every = np.arange( nnew )
+		newSrc = np.concatenate( (src, np.repeat(added, nnew), np.tile(every, count)) )
+		newDst = np.concatenate( (dst, np.tile(every, count), np.repeat(added, nnew)) )
+		real = newSrc != newDst
+		self._build( nnew, newSrc[real] * nnew + newDst[real] )
+
+
+''' <summary>
+	The cost matrix of a scenario whose edges are SparseEdges: values[k] is the cost of
+	the edge indices[k]. It indexes like the dense int32 matrix (NO_EDGE where there is
+	no edge), so solvers can use either one.
+	</summary> '''
+class SparseCosts:
+	dtype = np.dtype( np.int32 )
+
+	def __init__( self, edges, values ):
+		self.edges = edges
+		self.indptr = edges.indptr
+		self.indices = edges.indices
+		self.values = values
+		self.shape = edges.shape
+
+	def __len__( self ):
+		return len(self.edges)
+
+	def __getitem__( self, key ):
+		rows, cols = matrixIndex( key, len(self.edges) )
+		pos = self.edges.lookup( rows, cols )
+		found = self.values[np.maximum(pos, 0)] if len(self.values) > 0 else np.zeros( pos.shape, dtype=np.int32 )
+		return np.where( pos >= 0, found, np.int32(NO_EDGE) ).astype( np.int32 )[()]
+
+
+''' <summary>
+	A city of a scenario. This is only a small view: the coordinates and elevation are read
+	from the scenario's arrays and the name is made on demand, so there is nothing to set up
+	per city when a scenario is built.
+	</summary> '''
 class City:
-	def __init__( self, x, y, elevation=0.0 ):
-		self._x = x
-		self._y = y
-		self._elevation = elevation
-		self._scenario	= None
-		self._index = -1
-		self._name	= None
-
-	def setIndexAndName( self, index, name ):
-		self._index = index
-		self._name = name
+	__slots__ = ( '_scenario', '_index' )
 
-	def setScenario( self, scenario ):
+	def __init__( self, scenario, index ):
 		self._scenario = scenario
+		self._index = index
+
+	@property
+	def _x( self ):
+		return float( self._scenario._xs[self._index] )
+
+	@property
+	def _y( self ):
+		return float( self._scenario._ys[self._index] )
+
+	@property
+	def _elevation( self ):
+		return float( self._scenario._es[self._index] )
+
+	@property
+	def _name( self ):
+		return self._scenario.getCityName( self._index )
 
 	''' <summary>
 		How much does it cost to get from this city to the destination?
@@ -0,0 +1,410 @@
+#!/usr/bin/python3
+
+''' <summary>
+	The inner loops the solvers spend most of their time in, over numpy cost matrices:
+	matrix reduction, nearest-neighbor construction, the 2-opt delta scan and the exact
+	path DP over small windows of the tour. Matrices may
+	be int32 with NO_EDGE for missing edges (like Scenario.getCostMatrix) or float with inf.
+	nearestNeighborTour also takes a SparseCosts, and then only walks the edges there are.
+
+	Each kernel is written twice. The loop version is plain Python that Numba can compile;
+	when numba is importable it is JIT-compiled on first use and is the one that runs.
+	Otherwise the numpy version runs, which does the same work a row at a time. Both give
+	the same answers (ties go to the lowest index). setBackend forces one or the other,
+	e.g. for benchmarking.
+	</summary> '''
+
+import math
+import numpy as np
+from TSPClasses import NO_EDGE, floatView, SparseCosts
+
+try:
+	import numba
+	HAVE_NUMBA = True
+except ImportError:
+	numba = None
+	HAVE_NUMBA = False
+
+
+_backend = 'numba' if HAVE_NUMBA else 'numpy'
+
+
+def setBackend(name):
+	# 'numba', 'numpy' or 'auto' (numba if it is installed)
+	global _backend
+	if name == 'auto':
+		name = 'numba' if HAVE_NUMBA else 'numpy'
+	if name == 'numba' and not HAVE_NUMBA:
+		raise ValueError('numba is not installed')
+	if name not in ('numba', 'numpy'):
+		raise ValueError('unknown backend: ' + str(name))
+	_backend = name
+
+
+def getBackend():
+	return _backend
+
+
+def _missing(matrix):
+	# the entry that marks a missing edge in matrix
+	return NO_EDGE if np.issubdtype(matrix.dtype, np.integer) else math.inf
+
+
+def _total(matrix, amount):
+	# an amount of cost as an int for integer matrices (inf stays inf)
+	if amount == math.inf or not np.issubdtype(matrix.dtype, np.integer):
+		return float(amount)
+	return int(amount)
+
+
+_compiled = {}
+def _jit(loops):
+	# compile a loop kernel the first time it is asked for
+	if loops not in _compiled:
+		_compiled[loops] = numba.njit(cache=True)(loops)
+	return _compiled[loops]
+
+
+''' <summary>
+	Reduce matrix in place over the given rows and columns: subtract the least entry of
+	each row from that row, then the least of each column from that column.
+	</summary>
+	<returns>the total subtracted, or inf if some row or column has no edge left (the
+	matrix is left part way reduced then)</returns> '''
+def reduceMatrix(matrix, rows, cols):
+	rows = np.asarray(rows, dtype=np.int64)
+	cols = np.asarray(cols, dtype=np.int64)
+	if len(rows) == 0 or len(cols) == 0:
+		return _total(matrix, 0)
+	if _backend == 'numba':
+		return _total(matrix, _jit(_reduceLoops)(matrix, rows, cols, _missing(matrix)))
+	return _total(matrix, _reduceNumpy(matrix, rows, cols, _missing(matrix)))
+
+
+def _reduceLoops(matrix, rows, cols, missing):
+	# missing entries are the largest there are, so they are never the least of a row
+	# unless the whole row is missing. They are left alone when subtracting
+	total = 0.0
+	for r in rows:
+		least = missing
+		for c in cols:
+			if matrix[r, c] < least:
+				least = matrix[r, c]
+		if least == missing:
+			return np.inf
+		if least > 0:
+			for c in cols:
+				if matrix[r, c] != missing:
+					matrix[r, c] -= least
+			total += least
+	for c in cols:
+		least = missing
+		for r in rows:
+			if matrix[r, c] < least:
+				least = matrix[r, c]
+		if least == missing:
+			return np.inf
+		if least > 0:
+			for r in rows:
+				if matrix[r, c] != missing:
+					matrix[r, c] -= least
+			total += least
+	return total
+
+
+def _reduceNumpy(matrix, rows, cols, missing):
+	block = np.ix_(rows, cols)
+	sub = matrix[block]
+	gone = sub == missing
+	least = sub.min(axis=1)
+	if np.any(least == missing):
+		return math.inf
+	sub = np.where(gone, missing, sub - least[:, None])
+	colLeast = sub.min(axis=0)
+	if np.any(colLeast == missing):
+		return math.inf
+	sub = np.where(gone, missing, sub - colLeast[None, :])
+	matrix[block] = sub
+	return least.sum(dtype=float) + colLeast.sum(dtype=float)
+
+
+''' <summary>
+	The nearest-neighbor tour from start: always go to the cheapest city not visited yet.
+	</summary>
+	<returns>the tour as an array of city indices, or None if it got stuck or the last
+	city has no edge back to start</returns> '''
+def nearestNeighborTour(cost, start):
+	if isinstance(cost, SparseCosts):
+		# only look at the edges there are
+		if _backend == 'numba':
+			route = _jit(_nearestSparseLoops)(cost.indptr, cost.indices, cost.values, start)
+		else:
+			route = _nearestSparseNumpy(cost.indptr, cost.indices, cost.values, start)
+		return route if len(route) > 0 else None
+	if _backend == 'numba':
+		route = _jit(_nearestLoops)(cost, start, _missing(cost))
+	else:
+		route = _nearestNumpy(cost, start, _missing(cost))
+	return route if len(route) > 0 else None
+
+
+def _nearestLoops(cost, start, missing):
+	n = cost.shape[0]
+	route = np.empty(n, dtype=np.int64)
+	visited = np.zeros(n, dtype=np.bool_)
+	route[0] = start
+	visited[start] = True
+	cur = start
+	for step in range(1, n):
+		best = missing
+		nxt = -1
+		for c in range(n):
+			if not visited[c] and cost[cur, c] < best:
+				best = cost[cur, c]
+				nxt = c
+		if nxt < 0:
+			return route[:0]
+		route[step] = nxt
+		visited[nxt] = True
+		cur = nxt
+	if cost[cur, start] == missing:
+		return route[:0]
+	return route
+
+
+def _nearestNumpy(cost, start, missing):
+	n = cost.shape[0]
+	route = np.empty(n, dtype=np.int64)
+	visited = np.zeros(n, dtype=bool)
+	route[0] = start
+	visited[start] = True
+	cur = start
+	for step in range(1, n):
+		row = np.where(visited, missing, cost[cur])
+		nxt = int(np.argmin(row))
+		if row[nxt] == missing:
+			return route[:0]
+		route[step] = nxt
+		visited[nxt] = True
+		cur = nxt
+	if cost[cur, start] == missing:
+		return route[:0]
+	return route
+
+
+def _nearestSparseLoops(indptr, indices, values, start):
+	n = len(indptr) - 1
+	route = np.empty(n, dtype=np.int64)
+	visited = np.zeros(n, dtype=np.bool_)
+	route[0] = start
+	visited[start] = True
+	cur = start
+	for step in range(1, n):
+		best = -1
+		for k in range(indptr[cur], indptr[cur+1]):
+			if not visited[indices[k]] and (best < 0 or values[k] < values[best]):
+				best = k
+		if best < 0:
+			return route[:0]
+		cur = indices[best]
+		route[step] = cur
+		visited[cur] = True
+	for k in range(indptr[cur], indptr[cur+1]):
+		if indices[k] == start:
+			return route
+	return route[:0]
+
+
+def _nearestSparseNumpy(indptr, indices, values, start):
+	n = len(indptr) - 1
+	route = np.empty(n, dtype=np.int64)
+	visited = np.zeros(n, dtype=bool)
+	route[0] = start
+	visited[start] = True
+	cur = start
+	for step in range(1, n):
+		out = indices[indptr[cur]:indptr[cur+1]]
+		free = np.flatnonzero(~visited[out])
+		if len(free) == 0:
+			return route[:0]
+		cur = int(out[free[np.argmin(values[indptr[cur] + free])]])
+		route[step] = cur
+		visited[cur] = True
+	if not np.any(indices[indptr[cur]:indptr[cur+1]] == start):
+		return route[:0]
+	return route
+
+
+''' <summary>
+	Price every asymmetric 2-opt move on route: reversing route[i+1..j] swaps the edges at
+	both ends and turns every edge in between around. Reversals over a missing backward
+	edge are not allowed.
+	</summary>
+	<returns>(delta, i, j) of the best move, or (0, -1, -1) if none improves</returns> '''
+def twoOptScan(route, cost):
+	route = np.asarray(route, dtype=np.int64)
+	if _backend == 'numba' and not isinstance(cost, SparseCosts):
+		delta, i, j = _jit(_twoOptLoops)(route, cost, _missing(cost))
+	else:
+		delta, i, j = _twoOptNumpy(route, cost)
+	return float(delta), int(i), int(j)
+
+
+def _twoOptLoops(route, cost, missing):
+	n = len(route)
+	bestDelta = 0.0
+	bestI = -1
+	bestJ = -1
+	for i in range(n - 2):
+		a = route[i]
+		b = route[i+1]
+		removed = cost[a, b]
+		inside = 0.0 # what turning the edges i+1 .. j-1 around costs
+		# reversing everything but route[0] does nothing useful, so stop j short then
+		jEnd = n - 1 if i == 0 else n
+		for j in range(i + 2, jEnd):
+			back = cost[route[j], route[j-1]]
+			if back == missing:
+				break # and every longer reversal has this edge in it too
+			inside += back - cost[route[j-1], route[j]]
+			c = route[j]
+			d = route[(j+1) % n]
+			if cost[a, c] == missing or cost[b, d] == missing:
+				continue
+			delta = cost[a, c] + cost[b, d] - removed - cost[c, d] + inside
+			if delta < bestDelta:
+				bestDelta = delta
+				bestI = i
+				bestJ = j
+	return bestDelta, bestI, bestJ
+
+
+def _twoOptNumpy(route, cost):
+	# the same sums as _twoOptLoops, for every j at once with prefix sums along the route
+	# (in floats, with inf for missing edges)
+	cost = floatView(cost)
+	n = len(route)
+	after = np.roll(route, -1)
+	forward = cost[route, after] # edge k is route[k]->route[k+1]
+	backward = cost[after, route] # and this is route[k+1]->route[k]
+	missing = backward == math.inf
+	fwdSum = np.concatenate(([0], np.cumsum(forward)))
+	backSum = np.concatenate(([0], np.cumsum(np.where(missing, 0, backward))))
+	missSum = np.concatenate(([0], np.cumsum(missing)))
+	bestDelta, bestI, bestJ = 0.0, -1, -1
+	for i in range(n - 2):
+		j = np.arange(i + 2, n - 1 if i == 0 else n)
+		if len(j) == 0:
+			continue
+		inside = backSum[j] - backSum[i+1] - (fwdSum[j] - fwdSum[i+1])
+		with np.errstate(invalid='ignore'):
+			delta = cost[route[i], route[j]] + cost[route[i+1], route[(j+1) % n]] \
+					- forward[i] - forward[j] + inside
+		delta[(missSum[j] - missSum[i+1]) > 0] = math.inf
+		delta[np.isnan(delta)] = math.inf
+		k = int(np.argmin(delta))
+		if delta[k] < bestDelta:
+			bestDelta, bestI, bestJ = delta[k], i, int(j[k])
+	return bestDelta, bestI, bestJ
+
+
+''' <summary>
+	The cheapest path through each of a batch of small cost blocks (W, m, m), float with inf
+	for missing edges: from local city 0 to local city m-1, through all the others, found
+	exactly with a DP over the subsets of the m-2 cities in between (O(2^m m^2) a block, so
+	m has to stay small). The numpy version does the whole batch at once, a subset at a time.
+	</summary>
+	<returns>(orders, costs): orders[w] is the path as local indices (0 first and m-1 last)
+	and costs[w] its cost, inf (with the blocks' own order) if there is no path</returns> '''
+def bestPaths(blocks):
+	blocks = np.ascontiguousarray(blocks, dtype=float)
+	if blocks.shape[1] < 3:
+		orders = np.tile(np.arange(blocks.shape[1]), (len(blocks), 1))
+		costs = blocks[:, 0, -1] if blocks.shape[1] == 2 else np.zeros(len(blocks))
+		return orders, costs
+	if _backend == 'numba':
+		return _jit(_pathsLoops)(blocks)
+	return _pathsNumpy(blocks)
+
+
+def _pathsLoops(blocks):
+	count, m, _ = blocks.shape
+	k = m - 2
+	full = (1 << k) - 1
+	orders = np.empty((count, m), dtype=np.int64)
+	costs = np.empty(count)
+	# dp[mask, j] is the cheapest way from 0 through the cities in mask, ending at j
+	dp = np.empty((full + 1, k))
+	parent = np.empty((full + 1, k), dtype=np.int64)
+	for w in range(count):
+		b = blocks[w]
+		dp[:, :] = np.inf
+		for j in range(k):
+			dp[1 << j, j] = b[0, j+1]
+			parent[1 << j, j] = -1
+		for mask in range(1, full + 1):
+			for j in range(k):
+				d = dp[mask, j]
+				if d == np.inf:
+					continue
+				for l in range(k):
+					if mask & (1 << l):
+						continue
+					v = d + b[j+1, l+1]
+					if v < dp[mask | (1 << l), l]:
+						dp[mask | (1 << l), l] = v
+						parent[mask | (1 << l), l] = j
+		best = np.inf
+		last = -1
+		for j in range(k):
+			v = dp[full, j] + b[j+1, m-1]
+			if v < best:
+				best = v
+				last = j
+		costs[w] = best
+		for i in range(m):
+			orders[w, i] = i
+		# walk the parents back from the end
+		mask = full
+		at = m - 2
+		while last >= 0:
+			orders[w, at] = last + 1
+			at -= 1
+			before = parent[mask, last]
+			mask ^= 1 << last
+			last = before
+	return orders, costs
+
+
+def _pathsNumpy(blocks):
+	count, m, _ = blocks.shape
+	k = m - 2
+	full = (1 << k) - 1
+	inner = blocks[:, 1:-1, 1:-1]
+	dp = np.full((count, full + 1, k), math.inf)
+	parent = np.full((count, full + 1, k), -1, dtype=np.int64)
+	single = 1 << np.arange(k)
+	dp[:, single, np.arange(k)] = blocks[:, 0, 1:-1]
+	for mask in range(1, full):
+		# extend every path through mask by each city l not in it, from the best j
+		step = dp[:, mask, :, None] + inner
+		j = np.argmin(step, axis=1)
+		v = np.take_along_axis(step, j[:, None, :], axis=1)[:, 0, :]
+		out = np.flatnonzero((mask & single) == 0)
+		grown = mask | single[out]
+		better = v[:, out] < dp[:, grown, out]
+		dp[:, grown, out] = np.where(better, v[:, out], dp[:, grown, out])
+		parent[:, grown, out] = np.where(better, j[:, out], parent[:, grown, out])
+	total = dp[:, full, :] + blocks[:, 1:-1, -1]
+	last = np.argmin(total, axis=1)
+	costs = total[np.arange(count), last]
+	orders = np.tile(np.arange(m), (count, 1))
+	found = np.flatnonzero(costs < math.inf)
+	mask = np.full(len(found), full)
+	last = last[found]
+	for at in range(m - 2, 0, -1):
+		orders[found, at] = last + 1
+		before = parent[found, mask, last]
+		mask ^= 1 << last
+		last = before
+	return orders, costs
@@ -10,7 +10,15 @@ else:
 
 import time
 import copy
+import heapq
+import collections
+import sys
+import os
+import multiprocessing
+from multiprocessing import shared_memory
 from TSPClasses import *
+import TSPKernels
+import TSPTour
 
 
 class TSPSolver:
@@ -20,6 +28,13 @@ class TSPSolver:
 	def setupWithScenario( self, scenario ):
 		self._scenario = scenario
 
+	def needsCostMatrix( self, algorithm ):
+		# the solvers that work on the whole cost matrix would have to build all n^2 of it
+		# for a scenario with implicit edges, so they refuse those instead
+		if self._scenario.hasImplicitEdges():
+			raise ValueError('{} needs the full cost matrix, which is too big for {} cities; '
+							 'use greedy or decomposition instead'.format(algorithm, len(self._scenario.getCities())))
+
 
 	''' <summary>
 		This is the entry point for the default solver
@@ -42,7 +57,7 @@ class TSPSolver:
 		start_time = time.time()
 		while not foundTour and time.time()-start_time < time_allowance:
 			# create a random permutation
-			perm = math.random.permutation( ncities )
+			perm = np.random.permutation( ncities )
 			route = []
 			# Now build the route using the random permutation
 			for i in range( ncities ):
@@ -67,7 +82,8 @@ class TSPSolver:
 		This is the entry point for the greedy solver, which you must implement for 
 		the group project (but it is probably a good idea to just do it for the branch-and
 		bound project as a way to get your feet wet).  Note this could be used to find your
-		initial BSSF.
+		initial BSSF. On scenarios with implicit edges (see Scenario.hasImplicitEdges) the
+		tours are built from the candidate lists, without a cost matrix.
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number of solutions found, the best
@@ -83,52 +99,32 @@ class TSPSolver:
 		count = 0
 		bssf = None
 		start_time = time.time()
+		candidates = None
+		if self._scenario.hasImplicitEdges():
+			# too big for the cost matrix, so the tours are built from the candidate lists
+			candidates = self._scenario.getCandidates()
+		else:
+			cost = self._scenario.getCostMatrix()
 		
-		for start_city in cities:
+		for start_city in range(ncities):
 			if time.time() - start_time > time_allowance:
 				break # time out break
 			
-			# Now build the route
-			route = []
-			curr_city = start_city
-			fail = False
-			while len(route) < ncities:
-				# the shortest path from current_city. Starts as infinity
-				shortest_path = math.inf
-				next_city = None
-				for i in range(ncities):
-					if cities[i] is curr_city: # skip paths to ourself
-						continue
-					if cities[i] in route: # don't go to already visited
-						continue
-					dist = curr_city.costTo(cities[i])
-					if dist == math.inf: # verify that it is a valid path
-						continue
-					# If we made it thus far, then our path is valid. But is it shortest?
-					if dist < shortest_path:
-						shortest_path = dist
-						next_city = cities[i]
-				curr_city = next_city
-				# Verify that we actually found a valid path (sometimes no available- fail cond)
-				if shortest_path < math.inf:
-					route.append(curr_city) # append this to our route
-				else:
-					# fail case! We have to restart, but with the next starting point
-					fail = True
-					break
-			dist = route[-1].costTo(route[0])
-			if dist == math.inf:
-				fail = True
-			if fail:
+			# Now build the route (None when it gets stuck: we have to restart, but with
+			# the next starting point)
+			if candidates is None:
+				route = TSPKernels.nearestNeighborTour(cost, start_city)
+				routeCost = tourCost(cost, route) if route is not None else math.inf
+			else:
+				route, routeCost = candidateNearestNeighbor(self._scenario, candidates, start_city)
+			if route is None:
 				continue
 			
 			# If we successfully found a path (no fail), then test against previous attempts
 			count += 1
-			path = TSPSolution(route)
-			if bssf is None or path.cost < bssf.cost:
-				if path.cost < math.inf:
-					bssf = path
-					foundTour = True
+			if bssf is None or routeCost < bssf.cost:
+				bssf = TSPSolution([cities[i] for i in route])
+				foundTour = True
 
 		end_time = time.time()
 		results['cost'] = bssf.cost if foundTour else math.inf
@@ -142,15 +138,101 @@ class TSPSolver:
 
 
 
+	''' <summary>
+		This is the entry point for the space-filling curve solver. Cities are visited in the
+		order they appear along a Hilbert curve over the map, which only takes a sort
+		(O(n log n)), so it is a good way to get a start for local search at large n. On Hard
+		scenarios some of the curve's edges may not exist, so the cities after those are
+		pulled out and put back with cheapest insertion.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the tour,
+		time spent to find it, number of cities that had to be re-inserted, the tour found,
+		and three null values for fields not used for this algorithm</returns> 
+	'''
+	def hilbertTour( self, time_allowance=60.0 ):
+		cities = self._scenario.getCities()
+		start_time = time.time()
+		xs, ys, _ = self._scenario._cityArrays()
+		route = [int(i) for i in np.argsort(hilbertIndex(xs, ys), kind='stable')]
+		
+		repaired = 0
+		bssf = TSPSolution([cities[i] for i in route])
+		if bssf.cost == math.inf:
+			cost = self._scenario.getCostMatrix()
+			loose = []
+			i = 0
+			while i < len(route):
+				if len(route) > 1 and cost[route[i-1], route[i]] == NO_EDGE:
+					loose.append(route.pop(i))
+				else:
+					i += 1
+			repaired = len(loose)
+			route = cheapestInsertion(route, loose, cost)
+			bssf = TSPSolution([cities[i] for i in route]) if route is not None else None
+		
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = repaired
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		return results
+
+
+	''' <summary>
+		These are the entry points for the insertion solvers. Both grow a tour one city at a
+		time, always putting the city where it adds the least to the tour. Cheapest insertion
+		picks the city which is cheapest to insert next; farthest insertion picks the city
+		which is farthest from the tour (which spreads the tour out early and usually ends
+		up better). See insertionTour for how it is kept fast.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the tour,
+		time spent to find it, 1 (or 0 if it failed), the tour found, and three null values
+		for fields not used for this algorithm</returns> 
+	'''
+	def cheapestInsertionTour( self, time_allowance=60.0 ):
+		return self._insertionResults(False, time_allowance)
+
+	def farthestInsertionTour( self, time_allowance=60.0 ):
+		return self._insertionResults(True, time_allowance)
+
+	def _insertionResults( self, farthest, time_allowance ):
+		cities = self._scenario.getCities()
+		start_time = time.time()
+		route = insertionTour(self._scenario.getCostMatrix(), farthest, start_time + time_allowance)
+		bssf = TSPSolution([cities[i] for i in route]) if route is not None else None
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = 1 if bssf is not None else 0
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		return results
+
+
+
 	''' <summary>
 		This is the entry point for the algorithm you'll write for your group project.
+		With neighborhood='or3opt' the local search swaps neighboring segments instead (see
+		orThreeOpt), which never turns a segment around. With iterate the rest of the time
+		allowance goes to iterated local search from the tour that converged (see
+		iteratedLocalSearch); 'kicks' and 'kept' count its rounds. With a window of k
+		(8 to 12 is about right), every k cities in a row are put in their best order
+		after the descent, which finds what skips and swaps cannot (see windowSearch).
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number of solutions found during search, the 
 		best solution found.  You may use the other three field however you like.
 		algorithm</returns> 
 	'''
-	def fancy( self,time_allowance=60.0 ):
+	def fancy( self,time_allowance=60.0, neighborhood='skip', iterate=False, window=None ):
+		self.needsCostMatrix('fancy')
 		cities = self._scenario.getCities()
 		
 		start_time = time.time()
@@ -159,132 +241,29 @@ class TSPSolver:
 		# an alternative. If greedy fails, then we run a backtracking greedy variant to guarantee some
 		# valid path. Once we have a path, we can optimize it
 		
-		#initialize(cities)
 		# we can try using 2-opt, which is a local search algorithm to optimize what we get from greedy
 		bssf = self.greedy(60)
 		if bssf['cost'] == math.inf:
 			# greedy failed to give us a result. We *need* some path, so we use
-			# backtracking to guarantee
-			# we try to initialize with a smart starting city
-			startCity, connections = initialize(cities)
-			bssf = secureGreedy(connections, startCity, cities)
-			# if that fails, we have to run through all alternatives
-			for i in range(len(cities)):
-				if bssf['cost'] != math.inf:
-					break 
-				if i == startCity:
-					continue
-				bssf = secureGreedy(connections, i, cities)
-				if i+1 >= len(cities):
-					# We somehow managed to find nothing, even with the backtracking
-					return None
+			# the backtracking feasibility engine to find one
+			bssf = self.feasibleTour(time_allowance - (time.time() - start_time))
+			if bssf['soln'] is None:
+				# We somehow managed to find nothing, even with the backtracking. Its results
+				# say why, in 'failure'
+				return bssf
 
 		# now we go into the main local search loop
-		path = bssf['soln'].route
-		
-		# This is what we call "skip-ahead" optimizations
-		# ------------------------------------------
-		# skip limit must be less than the number of cities in the scenario
-		skipLimit = len(cities)
-		
-		alteration = True
-		while alteration and time.time() - start_time < time_allowance:
-			alteration = False # this is how I am doing a do-while loop
-			# there must be an alteration every time we cycle through all cities to keep going
-			# if no alterations are made, then we have converged and we can break out
-			
-			for i in range(len(path)):
-				skipStart = 2 # we have to go more than just 1, because that is the regular path
-				# we use currCost and backCost to see if the skip ahead is cheaper
-				# initialize current cost to the distance for the first 2 (since that is where skipping begins)
-				tempIndex = (i+1) % len(cities)
-				afterIndex = (i+skipStart) % len(cities) # this is started as what skip will be the first iteration
-				
-				currCost = path[i].costTo(path[tempIndex])
-				currCost += path[tempIndex].costTo(path[afterIndex])
-				backCost = 0
-				reverse = True
-				
-				for j in range(skipStart, skipLimit):
-					# we keep track of these to save computation time
-					skipIndex = afterIndex
-					afterIndex = (skipIndex + 1) % len(cities) # after is always 1 ahead of skip
-					
-					fail = False
-					# increase the min replaced cost for the next transition being skipped
-					currCost += path[skipIndex].costTo(path[afterIndex])
-					# if there is a skip ahead path
-					if path[i].costTo(path[skipIndex]) == math.inf:
-						fail = True # there is no direct path
-					# now we have to verify that the backwards path is valid
-					if path[skipIndex].costTo(path[skipIndex-1]) == math.inf:
-						# If there is no backwards path anywhere along the skip forward,
-						# then all further checks are invalidated. The future path would fail here
-						reverse = False
-					
-					backCost += path[skipIndex].costTo(path[skipIndex-1]) # Python handles negative indices (so we don't need %)
-					if fail: # if this skip is not viable (reverse or forward), go to the next
-						continue
-					
-					if reverse: # only if reverse is still valid
-						# if we got here, then the path back is valid, now we have to make the comparison to
-						# see if it is actually worth it to switch
-						
-						# we can keep track of the current path cost accurately
-						# The back path we cannot fully keep track of since the end points change each iteration,
-						# therefore, we need to add from i to skip and from the end of the reverse -> afterIndex and 
-						if currCost > backCost + path[i].costTo(path[skipIndex]) \
-											   + path[(i+1) % len(cities)].costTo(path[afterIndex]):
-							# if we are here, we need to make the path alteration
-							#print("Reverse from", i, "to", skipIndex)
-							alteration = True
-							
-							# reconstruct the path. We cannot simply use slices because we don't know if
-							# skipIndex is after i (the looping by % throws it off)
-							tempPath = [path[i]]
-							ii = skipIndex
-							while ii != i:
-								tempPath.append(path[ii])
-								ii = (ii-1) % len(path)
-							ii = afterIndex
-							while ii != i:
-								tempPath.append(path[ii])
-								ii = (ii+1) % len(path)					
-							path = tempPath
-							break
-					
-					# if reverse is not valid, then we can try a forward skip
-					# the forward skip jumps to the skipIndex then jumps back to finish the rest
-					# of the path until the skipIndex (at which point it continues to afterIndex).
-					# therefore, we can use currCost, which is the path so far
-					if currCost > currCost - path[i].costTo(path[(i+1) % len(cities)]) \
-										   - path[skipIndex-1].costTo(path[skipIndex]) \
-										   - path[skipIndex].costTo(path[afterIndex]) \
-										   + path[i].costTo(path[skipIndex]) \
-										   + path[skipIndex].costTo(path[(i+1) % len(cities)]) \
-										   + path[skipIndex-1].costTo(path[afterIndex]):
-						#print("Forward from", i, "to", skipIndex)
-						alteration = True
-						
-						# reconstruct the path. We cannot simply use slices because we don't know if
-						# skipIndex is after i (the looping by % throws it off)
-						tempPath = [path[i], path[skipIndex]]
-						ii = (i + 1) % len(path)
-						while ii != skipIndex:
-							tempPath.append(path[ii])
-							ii = (ii+1) % len(path)	
-						ii = afterIndex
-						while ii != i:
-							tempPath.append(path[ii])
-							ii = (ii+1) % len(path)	
-						path = tempPath
-						break
-				# if alteration made, we need to restart the upper path iteration
-				if alteration:
-					break
-			
+		# the tour is kept as an array of city indices, and moves are made on it in place
+		cost = self._scenario.getCostMatrix()
+		route = np.array([city._index for city in bssf['soln'].route])
 		
-		bssf = TSPSolution(path)
+		candidates = self._scenario.getCandidates() if neighborhood == 'or3opt' or iterate else None
+		search_start = time.time()
+		route, moves, kicks, kept = localSearch(route, cost, start_time + time_allowance, neighborhood,
+												iterate, candidates, window)
+		
+		search_time = time.time() - search_start
+		bssf = TSPSolution([cities[c] for c in route])
 
 		end_time = time.time()
 		#print(end_time - start_time)
@@ -296,6 +275,10 @@ class TSPSolver:
 		results['max'] = None
 		results['total'] = None
 		results['pruned'] = None
+		results['moves'] = moves
+		results['movesPerSecond'] = moves / search_time if search_time > 0 else 0.0
+		results['kicks'] = kicks
+		results['kept'] = kept
 		return results
 
 
@@ -304,59 +287,24 @@ class TSPSolver:
 		# this is a simplified greedy implementation just to give us a best so far
 		# for pruning on branch and bound
 		cities = self._scenario.getCities()
-		ncities = len(cities)
-		bssf = None
-		
-		# Now build the route
-		route = []
-		curr_city = cities[0]
-		fail = False
-		while len(route) < ncities:
-			# the shortest path from current_city. Starts as infinity
-			shortest_path = math.inf
-			next_city = None
-			for i in range(ncities):
-				if cities[i] is curr_city:  # skip paths to ourself
-					continue
-				if cities[i] in route:  # don't go to already visited
-					continue
-				dist = curr_city.costTo(cities[i])
-				if dist == math.inf:  # verify that it is a valid path
-					continue
-				# If we made it thus far, then our path is valid. But is it shortest?
-				if dist < shortest_path:
-					shortest_path = dist
-					next_city = cities[i]
-			curr_city = next_city
-			# Verify that we actually found a valid path (sometimes no available- fail cond)
-			if shortest_path < math.inf:
-				route.append(curr_city)  # append this to our route
-			else:
-				# fail case! We have to restart, but with the next starting point
-				fail = True
-				break
-		dist = route[-1].costTo(route[0])
-		if dist == math.inf:
-			fail = True
-
-		# If we successfully found a path (no fail), then test against previous attempts
-		path = TSPSolution(route)
-		if bssf is None or path.cost < bssf.cost:
-			if path.cost < math.inf:
-				bssf = path
-
+		# Now build the route, from city 0
+		route = TSPKernels.nearestNeighborTour(self._scenario.getCostMatrix(), 0)
+		if route is None:
+			return None
+		bssf = TSPSolution([cities[i] for i in route])
 		return bssf
 	
 	
 	def findMaxCost(self, mat):
 		# this is the min of (the sum of the max of each row) and (the sum of the max of each col)
+		matrix = floatView(mat.matrix)
 		rowsMax = 0
 		for i in range(len(mat.rowsAvailable)):
 			# choose some least to start out with
-			most = mat.matrix[mat.rowsAvailable[i]][mat.colsAvailable[0]]
+			most = matrix[mat.rowsAvailable[i]][mat.colsAvailable[0]]
 			for j in range(1, len(mat.colsAvailable)):
 				# try to find more than most but less than infinity
-				curr = mat.matrix[mat.rowsAvailable[i]][mat.colsAvailable[j]]
+				curr = matrix[mat.rowsAvailable[i]][mat.colsAvailable[j]]
 				if most == math.inf or (curr > most and curr < math.inf):
 					most = curr
 				
@@ -364,10 +312,10 @@ class TSPSolver:
 		colsMax = 0
 		for i in range(len(mat.colsAvailable)):
 			# choose some least to start out with
-			most = mat.matrix[mat.rowsAvailable[0]][mat.colsAvailable[i]]
+			most = matrix[mat.rowsAvailable[0]][mat.colsAvailable[i]]
 			for j in range(1, len(mat.rowsAvailable)):
 				# try to find more than most but less than infinity
-				curr = mat.matrix[mat.rowsAvailable[j]][mat.colsAvailable[i]]
+				curr = matrix[mat.rowsAvailable[j]][mat.colsAvailable[i]]
 				if most == math.inf or (curr > most and curr < math.inf):
 					most = curr
 				
@@ -376,102 +324,847 @@ class TSPSolver:
 	
 	
 	''' <summary>
-		This is the entry point for the branch-and-bound algorithm that you will implement
+		This is the entry point for the branch-and-bound algorithm that you will implement.
+		If sharedBound is given (a multiprocessing Value), it is read as an outside bssf
+		cost for pruning and every tour we find is published to it.
+		strategy picks the order states are expanded in (see makeFrontier): 'robin' (round
+		robin over the levels), 'best' (best-first), 'depth' (depth-first, children in
+		childOrder, without a frontier of matrices at all, see depthFirstBB) or 'hybrid'
+		(best-first until the frontier takes more than memoryBudget bytes, then depth-first
+		until it is back under).
+		States which visited the same cities and stand on the same city have the same
+		subproblem left, so only the cheapest of them is worth expanding. A table of up to
+		transpositions such states (see TranspositionTable) catches the rest
+		(transpositions=0 turns it off).
+		childOrder is the order the children of a state are made in (see orderChildren):
+		'column' (as they come), 'cost' (cheapest reduced edge first) or 'regret' (the edge
+		which would cost the most to leave out first). It decides which way the depth
+		strategy dives; the others only break ties with it. branching='edge' does not extend a
+		path city by city at all, but includes or excludes single edges (see edgeBranchBB).
+		With polish, the starting tour and every tour found at a leaf get a quick local
+		search (see polishTour) before they become the bssf, so the bound gets tight early.
+		With a checkpoint file, the search state is saved there every checkpointEvery
+		seconds and when the search stops, so that resumeBranchAndBound can carry on with
+		it (only for the strategies that keep a frontier: 'robin', 'best' and 'hybrid').
+		Scenarios with implicit edges are refused (see needsCostMatrix).
 		</summary>
 		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
 		time spent to find best solution, total number solutions found during search (does
 		not include the initial BSSF), the best solution found, and three more ints: 
-		max queue size, total number of states created, and number of pruned states.</returns> 
+		max queue size, total number of states created, and number of pruned states.
+		'memory' holds the most bytes the frontier ever took, 'cacheHits' and 'cachePruned'
+		the hits and prunes of the transposition table, 'polished' the number of tours
+		polishing improved, and 'optimal' whether the search ran out of states (so the
+		bssf is proven optimal).</returns> 
 	'''
-	def branchAndBound( self, time_allowance=60.0 ):	
+	MEMORY_BUDGET = 256 * 2**20 # bytes of frontier before the hybrid strategy dives
+	TRANSPOSITIONS = 100000 # states remembered by the transposition table
+	CHECKPOINT_EVERY = 60.0 # seconds between checkpoints
+	def branchAndBound( self, time_allowance=60.0, sharedBound=None, strategy='robin', memoryBudget=MEMORY_BUDGET,
+						transpositions=TRANSPOSITIONS, childOrder='regret', branching='sequence', polish=True,
+						checkpoint=None, checkpointEvery=CHECKPOINT_EVERY ):	
+		if checkpoint is not None and (strategy == 'depth' or branching == 'edge'):
+			raise ValueError('checkpoints are only kept for the robin, best and hybrid strategies')
+		self.needsCostMatrix('branchAndBound')
+		# the starting tour comes out of the same time allowance as the search
+		start_time = time.time()
 		# we need to start by creating the initial cost matrix from the graph
-		cities = self._scenario.getCities()
-		connections = [[cities[j].costTo(cities[i]) for i in range(len(cities))] for j in range(len(cities))]
-		startMatrix = CostMatrix(connections, 0)
-		# then we need to reduce it and find the lowest bound
-		startMatrix.reduce()
-		startMatrix.path.append(0) # we will always start on city 0
+		startMatrix = self.rootMatrix()
+		table = TranspositionTable(transpositions)
 		
 		# then we need to select some best so far to start with (use greedy)
 		greedyRes = self.greedyBB()
 		bssf = greedyRes
-		this = self
+		# cheapest insertion is usually a good deal better than greedy, so try it as well
+		insertRes = self.cheapestInsertionTour(time_allowance - (time.time() - start_time))
+		if insertRes['soln'] is not None and (bssf is None or insertRes['cost'] < bssf.cost):
+			bssf = insertRes['soln']
+		if bssf is None:
+			# both get stuck easily on sparse graphs, where any tour at all is a good start
+			bssf = self.feasibleTour(time_allowance - (time.time() - start_time))['soln']
+		polished = 0
+		if bssf is not None:
+			# other solvers (see portfolio) can prune with it while we polish and search
+			publishBound(sharedBound, bssf.cost)
+			if polish:
+				better = self.polishTour(bssf, start_time + time_allowance)
+				if better.cost < bssf.cost:
+					bssf = better
+					polished += 1
+					publishBound(sharedBound, bssf.cost)
 		
 		if bssf is None:
-			class EmptyPath:
-				def __init__(self):
-					self.cost = this.findMaxCost(startMatrix)
-			bssf = EmptyPath()
+			# the most a tour can cost is the reduction plus the most it can take from the
+			# reduced matrix (and one more, so such a tour isn't pruned)
+			bssf = EmptyPath(startMatrix.lowerBound + self.findMaxCost(startMatrix) + 1)
 		
-		# set up some stats variables
-		count = 0
-		maxFrontier = 1
-		totalGenerated = 0
-		totalPruned = 0
-		foundTour = False
+		if branching == 'edge':
+			return self.edgeBranchBB(startMatrix, bssf, sharedBound, polish, polished, start_time, time_allowance)
+		if strategy == 'depth':
+			return self.depthFirstBB(startMatrix, bssf, sharedBound, table, childOrder, polish, polished, start_time,
+									 time_allowance)
 		
 		# then we need to set up the queues that we will draw from
 		# we will construct multiple levels, and we can take a round robin approach in analyzing them
-		queue = RobinQueue()
+		queue = makeFrontier(strategy, memoryBudget)
 		# then we need to put the reduced matrix on that queue and expand it (start from city 0)
 		queue.insert(startMatrix)
+		settings = {'strategy': strategy, 'memoryBudget': memoryBudget, 'transpositions': transpositions,
+					'childOrder': childOrder, 'polish': polish}
+		return self.frontierBB(queue, bssf, sharedBound, table, settings, (0, 1, 0, 0, 0, polished),
+							   start_time, time_allowance, checkpoint, checkpointEvery)
+	
+	
+	''' <summary>
+		Carry on with a branch and bound search from a checkpoint that branchAndBound (or
+		an earlier resume) saved, for another time_allowance. The scenario has to be the
+		one the checkpoint was made for (see Scenario.fingerprint). The states of the
+		frontier come back with only their paths and bounds, and are only rebuilt (see
+		StateReplay) if they get expanded, since most of them are pruned by then. The
+		transposition table starts out empty, which only means less pruning at first. The
+		checkpoint is kept up to date the same way.
+		</summary>
+		<returns>the same results dictionary as branchAndBound, with the counts carried over
+		from the earlier runs (but the time of this run only)</returns> 
+	'''
+	def resumeBranchAndBound( self, checkpoint, time_allowance=60.0, sharedBound=None,
+							  checkpointEvery=CHECKPOINT_EVERY ):
+		self.needsCostMatrix('resumeBranchAndBound')
+		start_time = time.time()
+		cities = self._scenario.getCities()
+		saved = np.load(checkpoint, allow_pickle=False)
+		if str(saved['fingerprint']) != self._scenario.fingerprint():
+			raise ValueError('checkpoint {} was made for a different scenario'.format(checkpoint))
+		settings = {'strategy': str(saved['strategy']), 'memoryBudget': int(saved['memoryBudget']),
+					'transpositions': int(saved['transpositions']), 'childOrder': str(saved['childOrder']),
+					'polish': bool(saved['polish'])}
+		route = saved['bssfRoute']
+		if len(route) > 0:
+			bssf = TSPSolution([cities[i] for i in route])
+		else:
+			bssf = EmptyPath(float(saved['bssfCost']))
 		
-		stime = time.time()
+		queue = makeFrontier(settings['strategy'], settings['memoryBudget'])
+		lengths = saved['lengths']
+		paths = np.split(saved['paths'], np.cumsum(lengths)[:-1]) if len(lengths) > 0 else []
+		for path, bound, pathCost, expanded in zip(paths, saved['bounds'], saved['pathCosts'], saved['expanded']):
+			# a state without its matrix, which frontierBB rebuilds if it expands it
+			state = CostMatrix(None, float(bound), [], [])
+			state.path = [int(c) for c in path]
+			state.pathCost = int(pathCost)
+			state.expanded = int(expanded)
+			state.visited = sum(1 << c for c in state.path)
+			queue.insert(state)
+		table = TranspositionTable(settings['transpositions'])
+		replay = StateReplay(self.rootMatrix(), self._scenario.getCostMatrix())
+		return self.frontierBB(queue, bssf, sharedBound, table, settings, tuple(int(c) for c in saved['counters']),
+							   start_time, time_allowance, checkpoint, checkpointEvery, replay)
+	
+	
+	def rootMatrix( self ):
+		# the reduced cost matrix at the root of the branch and bound tree
+		connections = np.array(self._scenario.getCostMatrix()[:, :])
+		startMatrix = CostMatrix(connections, 0)
+		# then we need to reduce it and find the lowest bound
+		startMatrix.reduce()
+		startMatrix.path.append(0) # we will always start on city 0
+		startMatrix.visited = 1
+		return startMatrix
+	
+	
+	def frontierBB( self, queue, bssf, sharedBound, table, settings, counters, start_time, time_allowance,
+					checkpoint, checkpointEvery, replay=None ):
+		# The main loop of branchAndBound for the strategies that keep a frontier of states
+		# in queue. counters are the stats so far: (solutions found, biggest frontier, states
+		# generated, states pruned, most frontier memory, tours polished). The time allowance
+		# runs from start_time, so setting up the search counts too. States without a
+		# matrix (from a checkpoint) are rebuilt with replay when they are expanded
+		cities = self._scenario.getCities()
+		# the real costs, for the cost of the path so far
+		cost = self._scenario.getCostMatrix()
+		childOrder = settings['childOrder']
+		polish = settings['polish']
+		count, maxFrontier, totalGenerated, totalPruned, maxMemory, polished = counters
+		
+		stime = start_time
+		saved = time.time()
 		# continue expanding in a loop until no more on the queue or until time runs out
 		while queue.size > 0 and time.time()-stime <= time_allowance:
+			if checkpoint is not None and time.time() - saved >= checkpointEvery:
+				self.saveCheckpoint(checkpoint, queue, bssf, settings,
+									(count, maxFrontier, totalGenerated, totalPruned, maxMemory, polished))
+				saved = time.time()
 			toExpand = queue.getNext()
+			# another solver (see portfolio) may have found something better than our bssf
+			bound = bssf.cost
+			if sharedBound is not None and sharedBound.value < bound:
+				bound = sharedBound.value
 			# check that we haven't gotten a better solution than this since we added it
-			if toExpand.lowerBound >= bssf.cost:
+			if toExpand.lowerBound >= bound:
+				totalPruned += 1
+				continue
+			# or a cheaper way to the same state
+			if table.beaten(toExpand.visited, toExpand.path[-1], toExpand.pathCost):
 				totalPruned += 1
 				continue
+			if toExpand.matrix is None:
+				expanded = toExpand.expanded
+				toExpand = replay.state(toExpand.path)
+				toExpand.expanded = expanded
 			# now we can expand it- we can expand a possibility for every non-infinite entry in the row
 			cityAt = toExpand.path[-1]
 			# for each matrix that it expands to, check to verify that it is not too big and add to queue
 			# we also want to skip a path back to city 0 until the very end
-			for i in range(1, len(toExpand.colsAvailable)):
-				if toExpand.matrix[cityAt][toExpand.colsAvailable[i]] < math.inf:
-					newMat = toExpand.select(toExpand.colsAvailable[i])
-					totalGenerated += 1
-					# check if the path is now complete
-					if len(newMat.path) == len(cities):
-						# we have to connect to the beginning (city 0)
-						newMat.lowerBound += newMat.matrix[newMat.path[-1]][0]
-						# we found a solution if lower bound is less than infinite
-						if newMat.lowerBound < bssf.cost: # it was better than the bssf!
-							foundTour = True
-							count += 1 # we found another solution
-							bssf = TSPSolution(newMat.getPathCities(cities))
-						else:
-							totalPruned += 1
-						continue
-					
-					# otherwise, reduce and try to add to queue
-					newMat.reduce()
-					if newMat.lowerBound < bssf.cost:
-						queue.insert(newMat)
-						if queue.size > maxFrontier:
-							maxFrontier = queue.size
+			children = orderChildren(toExpand.matrix, toExpand.rowsAvailable, toExpand.colsAvailable, cityAt, childOrder)
+			for k in range(toExpand.expanded, len(children)):
+				nextCity = children[k]
+				if time.time()-stime > time_allowance:
+					# a big state takes a while to expand, so we stop halfway if time runs out.
+					# It goes back on the queue so that it is not lost (from a checkpoint too),
+					# and carries on from the first child it has not made yet
+					toExpand.expanded = k
+					queue.insert(toExpand)
+					break
+				totalGenerated += 1
+				# the edge alone may already cost too much, and then we don't need to copy and reduce
+				if toExpand.lowerBound + toExpand.edge(cityAt, nextCity) >= bound:
+					totalPruned += 1
+					continue
+				newMat = toExpand.select(nextCity, int(cost[cityAt, nextCity]))
+				# check if the path is now complete
+				if len(newMat.path) == len(cities):
+					# we have to connect to the beginning (city 0)
+					newMat.lowerBound += newMat.edge(newMat.path[-1], 0)
+					# we found a solution if lower bound is less than infinite
+					if newMat.lowerBound < bound: # it was better than the bssf!
+						count += 1 # we found another solution
+						bssf = TSPSolution(newMat.getPathCities(cities))
+						if polish:
+							better = self.polishTour(bssf, stime + time_allowance)
+							if better.cost < bssf.cost:
+								bssf = better
+								polished += 1
+						bound = bssf.cost
+						publishBound(sharedBound, bound)
 					else:
 						totalPruned += 1
+					continue
+				
+				# otherwise, reduce and try to add to queue
+				newMat.reduce()
+				if newMat.lowerBound < bound and not table.dominated(newMat.visited, newMat.path[-1], newMat.pathCost):
+					queue.insert(newMat)
+					if queue.size > maxFrontier:
+						maxFrontier = queue.size
+					if queue.bytes > maxMemory:
+						maxMemory = queue.bytes
+				else:
+					totalPruned += 1
+		
+		if checkpoint is not None:
+			self.saveCheckpoint(checkpoint, queue, bssf, settings,
+								(count, maxFrontier, totalGenerated, totalPruned, maxMemory, polished))
 		
 		# After that is all done, set the stats from the run
 		etime = time.time()
 		results = {}
-		results['cost'] = bssf.cost if foundTour else math.inf
+		results['cost'] = bssf.cost if isinstance(bssf, TSPSolution) else math.inf # the (polished) starting tour counts too
 		results['time'] = etime - stime
 		results['count'] = count
 		results['soln'] = bssf
 		results['max'] = maxFrontier
+		results['memory'] = maxMemory
 		results['total'] = totalGenerated
 		results['pruned'] = totalPruned
+		results['cacheHits'] = table.hits
+		results['cachePruned'] = table.pruned
+		results['polished'] = polished
+		# if the frontier was exhausted, nothing better than the bound can exist
+		results['optimal'] = queue.size == 0
+		return results
+	
+	
+	def saveCheckpoint( self, checkpoint, queue, bssf, settings, counters ):
+		# write the search state to the file checkpoint: the path of every state on the
+		# frontier (which is all it takes to rebuild it, see resumeBranchAndBound), the
+		# bssf, the counters and the settings, and the scenario's fingerprint. The file is
+		# written next to it first and then moved over, so a crash never leaves half of one
+		states = list(queue.states())
+		paths = [state.path for state in states]
+		route = [city._index for city in bssf.route] if isinstance(bssf, TSPSolution) else []
+		state = dict(settings)
+		state['fingerprint'] = self._scenario.fingerprint()
+		state['bssfRoute'] = np.array(route, dtype=np.int64)
+		state['bssfCost'] = float(bssf.cost)
+		state['counters'] = np.array(counters, dtype=np.int64)
+		state['lengths'] = np.array([len(path) for path in paths], dtype=np.int64)
+		state['paths'] = np.array([c for path in paths for c in path], dtype=np.int32)
+		state['bounds'] = np.array([s.lowerBound for s in states], dtype=float)
+		state['pathCosts'] = np.array([s.pathCost for s in states], dtype=np.int64)
+		state['expanded'] = np.array([s.expanded for s in states], dtype=np.int64)
+		partial = checkpoint + '.partial'
+		with open(partial, 'wb') as f:
+			np.savez_compressed(f, **state)
+		os.replace(partial, checkpoint)
+
+
+	''' <summary>
+		Quick local search for a tour found by branch and bound: or-opt and 2-opt (see
+		orOpt and twoOpt) until neither finds anything or the deadline passes.
+		</summary>
+		<returns>the polished TSPSolution (the same one if nothing was better)</returns> 
+	'''
+	def polishTour( self, solution, deadline ):
+		cities = self._scenario.getCities()
+		cost = self._scenario.getCostMatrix()
+		route = [city._index for city in solution.route]
+		moves = 1
+		while moves > 0 and time.time() < deadline:
+			route, orMoves = orOpt(route, cost, route, deadline)
+			route, twoMoves = twoOpt(route, cost, deadline)
+			moves = orMoves + twoMoves
+		better = TSPSolution([cities[i] for i in route])
+		return better if better.cost < solution.cost else solution
+
+
+	''' <summary>
+		The depth-first path of branchAndBound, starting from the reduced startMatrix.
+		Instead of copying the cost matrix for every child, we keep one WorkingCostMatrix
+		which is changed in place as we go down the tree and put back with its undo log as
+		we come back up. The children of a state are visited in childOrder (see
+		orderChildren), and each one is only bounded (select, reduce) when we get to it, so
+		the ones after a good tour is found are mostly pruned without being reduced at all.
+		That way each state on the path only costs O(n) for its undo entries, and nothing
+		is allocated per child.
+		</summary>
+		<returns>the same results dictionary as branchAndBound. 'max' is the most children
+		waiting on the path at once.</returns> 
+	'''
+	def depthFirstBB( self, startMatrix, bssf, sharedBound, table, childOrder, polish, polished, start_time,
+					  time_allowance ):
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		count = 0
+		maxFrontier = 1
+		maxMemory = 0
+		totalGenerated = 0
+		totalPruned = 0
+		bound = bssf.cost
+		
+		stime = start_time
+		# startMatrix is already reduced and starts on city 0
+		work = WorkingCostMatrix(startMatrix.matrix, startMatrix.lowerBound)
+		work.path.append(0)
+		work.visited = 1
+		cost = self._scenario.getCostMatrix()
+		
+		def children():
+			# the children of the current state still to visit, in childOrder (the first
+			# one last, since we pop them off the end)
+			kids = orderChildren(work.matrix, work.openRows(), work.openCols(), work.path[-1], childOrder)
+			kids.reverse()
+			return kids
+		
+		stack = [children()]
+		waiting = len(stack[0])
+		while len(stack) > 0 and time.time()-stime <= time_allowance:
+			# another solver (see portfolio) may have found something better than our bssf
+			if sharedBound is not None and sharedBound.value < bound:
+				bound = sharedBound.value
+			kids = stack[-1]
+			if len(kids) == 0:
+				# done with this state, go back up to its parent
+				stack.pop()
+				if len(stack) > 0:
+					work.undo()
+				continue
+			nextCity = kids.pop()
+			waiting -= 1
+			totalGenerated += 1
+			cityAt = work.path[-1]
+			# the edge alone may already cost too much, and then we don't need to reduce
+			if work.lowerBound + work.edge(cityAt, nextCity) >= bound:
+				totalPruned += 1
+				continue
+			work.mark()
+			work.select(nextCity, int(cost[cityAt, nextCity]))
+			if len(work.path) == ncities:
+				# we have to connect to the beginning (city 0)
+				total = work.lowerBound + work.edge(nextCity, 0)
+				if total < bound: # it was better than the bssf!
+					count += 1 # we found another solution
+					bssf = TSPSolution([cities[i] for i in work.path])
+					if polish:
+						better = self.polishTour(bssf, stime + time_allowance)
+						if better.cost < bssf.cost:
+							bssf = better
+							polished += 1
+					bound = bssf.cost
+					publishBound(sharedBound, bound)
+				else:
+					totalPruned += 1
+				work.undo()
+				continue
+			work.reduce()
+			# prune it if it can't beat the bssf, or if there was a cheaper way to the same state
+			if work.lowerBound >= bound or table.dominated(work.visited, nextCity, work.pathCost):
+				totalPruned += 1
+				work.undo()
+				continue
+			kids = children()
+			stack.append(kids)
+			waiting += len(kids)
+			maxFrontier = max(maxFrontier, waiting)
+			maxMemory = max(maxMemory, work.memory())
+		
+		etime = time.time()
+		results = {}
+		results['cost'] = bssf.cost if isinstance(bssf, TSPSolution) else math.inf # the (polished) starting tour counts too
+		results['time'] = etime - stime
+		results['count'] = count
+		results['soln'] = bssf
+		results['max'] = maxFrontier
+		results['memory'] = maxMemory
+		results['total'] = totalGenerated
+		results['pruned'] = totalPruned
+		results['cacheHits'] = table.hits
+		results['cachePruned'] = table.pruned
+		results['polished'] = polished
+		# if we backed all the way out, nothing better than the bound can exist
+		results['optimal'] = len(stack) == 0
+		return results
+
+
+	''' <summary>
+		Branch and bound on edges instead of paths (Little's algorithm), starting from the
+		reduced startMatrix. Every state picks the zero entry (i,j) of its matrix with the
+		highest penalty (what it would add to the bound to leave it out) and splits in two:
+		one child includes i->j (row i and column j go away, and the edge that would close
+		a cycle with i->j's chain is blocked), the other excludes it (the entry becomes
+		infinite, and reducing again adds the penalty). The including child is usually the
+		cheap one, so good tours come quickly. States are expanded best-first.
+		</summary>
+		<returns>the same results dictionary as branchAndBound</returns> 
+	'''
+	def edgeBranchBB( self, startMatrix, bssf, sharedBound, polish, polished, start_time, time_allowance ):
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		count = 0
+		maxFrontier = 1
+		totalGenerated = 0
+		totalPruned = 0
+		foundTour = False
+		bound = bssf.cost
+		
+		stime = start_time
+		queue = []
+		made = 0 # tiebreak for the heap, so it never compares states
+		queue.append((startMatrix.lowerBound, 0, made, EdgeState(startMatrix.matrix, startMatrix.lowerBound)))
+		while len(queue) > 0 and time.time()-stime <= time_allowance:
+			# another solver (see portfolio) may have found something better than our bssf
+			if sharedBound is not None and sharedBound.value < bound:
+				bound = sharedBound.value
+			state = heapq.heappop(queue)[3]
+			if state.lowerBound >= bound:
+				totalPruned += 1
+				continue
+			edge = state.branchEdge()
+			if edge is None:
+				totalPruned += 1
+				continue
+			for child in (state.include(*edge), state.exclude(*edge)):
+				totalGenerated += 1
+				if child.lowerBound >= bound:
+					totalPruned += 1
+					continue
+				if child.included == ncities:
+					route = child.route()
+					tour = TSPSolution([cities[i] for i in route])
+					if tour.cost < bound: # it was better than the bssf!
+						foundTour = True
+						count += 1 # we found another solution
+						bssf = tour
+						if polish:
+							better = self.polishTour(bssf, stime + time_allowance)
+							if better.cost < bssf.cost:
+								bssf = better
+								polished += 1
+						bound = bssf.cost
+						publishBound(sharedBound, bound)
+					else:
+						totalPruned += 1
+					continue
+				made += 1
+				# deeper states go first on ties, to get to tours sooner
+				heapq.heappush(queue, (child.lowerBound, -child.included, made, child))
+				maxFrontier = max(maxFrontier, len(queue))
+		
+		etime = time.time()
+		results = {}
+		results['cost'] = bssf.cost if isinstance(bssf, TSPSolution) else math.inf # the (polished) starting tour counts too
+		results['time'] = etime - stime
+		results['count'] = count
+		results['soln'] = bssf
+		results['max'] = maxFrontier
+		results['memory'] = maxFrontier * 4 * ncities * ncities # an int32 matrix per state
+		results['total'] = totalGenerated
+		results['pruned'] = totalPruned
+		results['cacheHits'] = 0
+		results['cachePruned'] = 0
+		results['polished'] = polished
+		results['optimal'] = len(queue) == 0
+		return results
+
+
+	''' <summary>
+		This is the entry point for the feasibility engine. It does not care about cost at
+		all, it only wants *some* valid tour, which is what we need on thinned (Hard) graphs
+		when greedy fails. See HamiltonSearch for how the search works.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the tour found,
+		time spent, number of backtracks, the tour found, and then the number of cycle
+		covers tried, the number of steps taken and the number of dead ends pruned. If no
+		tour was found, 'failure' explains why (otherwise it is None).</returns> 
+	'''
+	def feasibleTour( self, time_allowance=60.0 ):
+		cities = self._scenario.getCities()
+		start_time = time.time()
+		search = HamiltonSearch(self._scenario._edge_exists, self._scenario.getCostMatrix())
+		route = search.run(start_time + time_allowance)
+		
+		bssf = TSPSolution([cities[i] for i in route]) if route is not None else None
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = search.backtracks
+		results['soln'] = bssf
+		results['max'] = search.covers
+		results['total'] = search.steps
+		results['pruned'] = search.pruned
+		results['failure'] = search.failure
+		return results
+
+
+	''' <summary>
+		Warm start: re-solve after the scenario changed slightly instead of starting over.
+		The previous tour (a TSPSolution or a list of city indices, in the numbering from
+		before the change) is carried through the delta (see ScenarioDelta): removed cities
+		are dropped, cities on edges which no longer exist are pulled out, and then every
+		loose or new city is put back with cheapest insertion. Finally we run or-opt only
+		around the cities that were touched.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of solution, 
+		time spent to find solution, number of local search moves applied, the solution
+		found, and three null values. 'remap' holds the old->new city index mapping.</returns> 
+	'''
+	def warmStart( self, previous, delta, time_allowance=60.0 ):
+		start_time = time.time()
+		if isinstance(previous, TSPSolution):
+			previous = [city._index for city in previous.route]
+		
+		remap = self._scenario.applyDelta(delta)
+		cities = self._scenario.getCities()
+		cost = self._scenario.getCostMatrix()
+		
+		# carry the old tour over into the new numbering
+		route = [remap[i] for i in previous if remap[i] >= 0]
+		touched = set()
+		for i in range(len(previous)):
+			# the neighbors of a removed city now have a new edge between them
+			if remap[previous[i]] < 0:
+				touched.add(remap[previous[i-1]])
+				touched.add(remap[previous[(i+1) % len(previous)]])
+		# pull out cities until every edge left in the tour exists
+		loose = list(range(len(cities) - len(delta.addedCities), len(cities)))
+		broken = True
+		while broken and len(route) > 1:
+			broken = False
+			for i in range(len(route)):
+				if cost[route[i-1], route[i]] == NO_EDGE:
+					loose.append(route.pop(i))
+					broken = True
+					break
+		
+		route = cheapestInsertion(route, loose, cost)
+		if route is None:
+			# the tour could not be repaired, so fall back to solving from scratch
+			return self.fancy(time_allowance - (time.time() - start_time))
+		touched.update(loose)
+		touched.discard(-1)
+		
+		route, moves = orOpt(route, cost, touched, start_time + time_allowance)
+		
+		bssf = TSPSolution([cities[i] for i in route])
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost
+		results['time'] = end_time - start_time
+		results['count'] = moves
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['remap'] = remap
+		return results
+
+
+	''' <summary>
+		This is the entry point for the portfolio solver. Instead of choosing an algorithm
+		from the drop-down, we race several of them in a process pool. They all share the
+		best cost found so far, so branch and bound can prune with the tours the heuristics
+		find. The losers are killed once the time allowance expires or once branch and bound
+		proves that the best tour is optimal.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of best solution, 
+		time spent to find best solution, number of solvers that found a tour, the best
+		solution found, and the max/total/pruned stats of branch and bound (if it reported).
+		'solver' holds the name of the solver which produced the answer.</returns> 
+	'''
+	PORTFOLIO = ['greedy', 'fancy', 'branchAndBound']
+	def portfolio( self, time_allowance=60.0, solvers=None ):
+		if solvers is None:
+			solvers = self.PORTFOLIO
+			if self._scenario.hasImplicitEdges():
+				# the others would only refuse it (see needsCostMatrix)
+				solvers = ['greedy']
+		cities = self._scenario.getCities()
+		
+		start_time = time.time()
+		sharedBest = multiprocessing.Value('d', math.inf)
+		# every solver gets its own process, since they are supposed to race
+		pool = multiprocessing.Pool(len(solvers), initializer=_portfolioInit, initargs=(sharedBest,))
+		# leave a little slack so that the workers can report back before we kill them
+		workerAllowance = time_allowance * 0.95
+		pending = {}
+		for name in solvers:
+			pending[name] = pool.apply_async(_portfolioWorker, (name, self._scenario, workerAllowance))
+		
+		bestCost = math.inf
+		bestRoute = None
+		bestSolver = None
+		count = 0
+		proven = False
+		bbResults = {}
+		try:
+			while pending and time.time() - start_time < time_allowance:
+				for name in list(pending.keys()):
+					if not pending[name].ready():
+						continue
+					res = pending.pop(name).get()
+					if res['route'] is not None:
+						count += 1
+						if res['cost'] < bestCost:
+							bestCost = res['cost']
+							bestRoute = res['route']
+							bestSolver = name
+					if name == 'branchAndBound':
+						bbResults = res
+						proven = res['optimal']
+				# once optimality is proven, we only have to wait for the tour with the shared cost
+				if proven and bestCost <= sharedBest.value:
+					break
+				time.sleep(0.005)
+		finally:
+			# whoever is still running lost the race
+			pool.terminate()
+			pool.join()
+		
+		end_time = time.time()
+		results = {}
+		results['cost'] = bestCost
+		results['time'] = end_time - start_time
+		results['count'] = count
+		results['soln'] = TSPSolution([cities[i] for i in bestRoute]) if bestRoute is not None else None
+		results['max'] = bbResults.get('max')
+		results['total'] = bbResults.get('total')
+		results['pruned'] = bbResults.get('pruned')
+		results['solver'] = bestSolver
+		results['optimal'] = proven
+		return results
+
+
+	''' <summary>
+		This is the entry point for the decomposition solver, for scenarios far too big for
+		anything that looks at every pair of cities (100k cities and up). The cities are
+		split into spatial clusters of about clusterSize with k-means, and the clusters are
+		put in order by a coarse tour over their centroids. Between each cluster and the
+		next we pick the cheapest existing edge near the border, which fixes where every
+		cluster is entered and left. Then each cluster is solved on its own, as a path
+		between those two cities (see pathTour), in a process pool, and the paths are
+		strung together. Last, a window around every seam is re-solved the same way, since
+		that is where the stitching leaves the tour worst. No cost matrix bigger than a
+		cluster is ever built.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the tour,
+		time spent to find it, number of clusters, the tour found, and then the number of
+		seams that the last pass improved. 'hurried' counts the clusters that ran out of
+		time and only got a nearest neighbor path. If no tour was found, 'failure' explains
+		why (otherwise it is None).</returns>
+	'''
+	CLUSTER_SIZE = 300 # cities per cluster, roughly
+	SEAM_WINDOW = 25 # cities on either side of a seam that the last pass re-solves
+	BORDER_CANDIDATES = 40 # cities of each cluster tried for the edge to the next one
+	def decomposition( self, time_allowance=60.0, clusterSize=CLUSTER_SIZE, processes=None ):
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		xs, ys, _ = self._scenario._cityArrays()
+
+		clusters = kMeansClusters(xs, ys, max(1, int(round(ncities / clusterSize))))
+		order = coarseTour([xs[c].mean() for c in clusters], [ys[c].mean() for c in clusters])
+		clusters = [clusters[k] for k in order]
+
+		failure = None
+		route = None
+		improved = 0
+		hurried = 0
+		if len(clusters) == 1:
+			ends = [(None, None)]
+		else:
+			ends = borderEdges(self._scenario, clusters, self.BORDER_CANDIDATES)
+			if ends is None:
+				failure = 'no edge between some pair of neighboring clusters'
+		if failure is None:
+			pool = multiprocessing.Pool(processes, initializer=_decompositionInit, initargs=(self._scenario,))
+			try:
+				tasks = [(clusters[k], ends[k][0], ends[k][1], None, deadline) for k in range(len(clusters))]
+				paths, late = zip(*pool.map(_pathWorker, tasks))
+				hurried = sum(late)
+				if any(path is None for path in paths):
+					k = [path is None for path in paths].index(True)
+					if late[k]:
+						failure = 'ran out of time before cluster {} had a path between its border cities'.format(k)
+					else:
+						failure = 'cluster {} has no path between its border cities'.format(k)
+				else:
+					route = np.concatenate(paths)
+					# the seams, each windowed so that no two windows overlap
+					starts = np.cumsum([0] + [len(path) for path in paths])
+					windows = []
+					for k in range(1, len(paths)):
+						lo = max(starts[k] - self.SEAM_WINDOW, starts[k-1] + len(paths[k-1]) // 2)
+						hi = min(starts[k] + self.SEAM_WINDOW, starts[k] + len(paths[k]) // 2)
+						if hi - lo > 3:
+							windows.append((lo, hi))
+					tasks = [(route[lo:hi], 0, hi - lo - 1, list(range(hi - lo)), deadline) for lo, hi in windows]
+					for (lo, hi), (path, _) in zip(windows, pool.map(_pathWorker, tasks)):
+						if path is not None and not np.array_equal(path, route[lo:hi]):
+							route[lo:hi] = path
+							improved += 1
+			finally:
+				pool.terminate()
+				pool.join()
+
+		bssf = TSPSolution([cities[i] for i in route]) if route is not None else None
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = len(clusters)
+		results['soln'] = bssf
+		results['max'] = improved
+		results['total'] = None
+		results['pruned'] = None
+		results['failure'] = failure
+		results['hurried'] = hurried
+		return results
+
+
+	''' <summary>
+		This is the entry point for the multi-start solver. It builds nearest-neighbor tours
+		from as many start cities as it can in part of the time allowance and keeps the best
+		few that are different tours. Each of those then gets the local search of fancy (see
+		localSearch, with neighborhood and iterate as there) in a process pool. The cost
+		matrix goes to the workers in shared memory, so they do not each get a copy of it.
+		The time that is left is split evenly over the starts.
+		</summary>
+		<returns>results dictionary for GUI that contains three ints: cost of the best tour,
+		time spent, number of starts searched, the best tour, and three null values.
+		'starts' has, for every start, its cost before and after the local search, the
+		moves, kicks and kept kicks it made and the time it took.</returns>
+	'''
+	MULTI_STARTS = 8
+	CONSTRUCTION_SHARE = 0.2 # of the time allowance, for building the starting tours
+	def multiStart( self, time_allowance=60.0, starts=MULTI_STARTS, processes=None, neighborhood='skip',
+					iterate=True ):
+		cities = self._scenario.getCities()
+		ncities = len(cities)
+		start_time = time.time()
+		deadline = start_time + time_allowance
+		cost = self._scenario.getCostMatrix()
+		
+		# the same cycle from another start city is not a new tour, so tours are kept by
+		# their rotation that starts at city 0
+		tours = {}
+		for start_city in np.random.permutation(ncities):
+			if time.time() - start_time > time_allowance * self.CONSTRUCTION_SHARE:
+				break
+			route = TSPKernels.nearestNeighborTour(cost, int(start_city))
+			if route is not None:
+				tours[tuple(np.roll(route, -int(np.argmin(route))))] = tourCost(cost, route)
+		if len(tours) == 0:
+			# greedy got stuck everywhere, so we start from what the feasibility search finds
+			res = self.feasibleTour(time_allowance * self.CONSTRUCTION_SHARE)
+			if res['soln'] is not None:
+				tours[tuple(city._index for city in res['soln'].route)] = res['cost']
+		chosen = sorted(tours, key=tours.get)[:starts]
+		
+		stats = []
+		bestCost = math.inf
+		bestRoute = None
+		if len(chosen) > 0:
+			workers = min(processes or multiprocessing.cpu_count(), len(chosen))
+			share = (deadline - time.time()) * workers / len(chosen)
+			candidates = self._scenario.getCandidates() if neighborhood == 'or3opt' or iterate else None
+			shared, matrix = shareMatrix(cost)
+			pool = multiprocessing.Pool(workers, initializer=_multiStartInit, initargs=(matrix, candidates))
+			try:
+				# leave a little slack so that the workers can report back in time
+				tasks = [(route, share * 0.95, deadline, neighborhood, iterate) for route in chosen]
+				for res in pool.map(_multiStartWorker, tasks):
+					if res['cost'] < bestCost:
+						bestCost = res['cost']
+						bestRoute = res.pop('route')
+					else:
+						del res['route']
+					stats.append(res)
+			finally:
+				pool.terminate()
+				pool.join()
+				if shared is not None:
+					shared.close()
+					shared.unlink()
+		
+		bssf = TSPSolution([cities[i] for i in bestRoute]) if bestRoute is not None else None
+		end_time = time.time()
+		results = {}
+		results['cost'] = bssf.cost if bssf is not None else math.inf
+		results['time'] = end_time - start_time
+		results['count'] = len(stats)
+		results['soln'] = bssf
+		results['max'] = None
+		results['total'] = None
+		results['pruned'] = None
+		results['starts'] = stats
 		return results
 
 	
+class EmptyPath:
+	# stands in for the bssf when there is no tour yet: only its cost, the bound to beat
+	def __init__(self, cost):
+		self.cost = cost
+
+
 class CostMatrix:
 	def __init__(self, matrix, lowerBound, rowsAvailable=None, colsAvailable=None):
 		self.matrix = matrix
 		self.path = []
 		self.lowerBound = lowerBound
+		self.pathCost = 0 # the real cost of the path so far
+		self.visited = 0 # bitmask of the cities on the path
+		self.expanded = 0 # children already made (by an expansion that ran out of time)
 		# compute rows available and cols available from given matrix if not given
 		if rowsAvailable is None:
 			self.rowsAvailable = [i for i in range(len(matrix))]
@@ -484,63 +1177,17 @@ class CostMatrix:
 	
 	
 	def reduce(self):
-		# we need to find a zero in each row and in each column
-		# There needs to be a zero in each row and column
-		# For each row
-		for i in range(len(self.rowsAvailable)):
-			# choose some least to start out with
-			least = self.matrix[self.rowsAvailable[i]][self.colsAvailable[0]]
-			if least == 0:
-				continue
-			for j in range(1, len(self.colsAvailable)):
-				# if the current index is less than least, replace it
-				if self.matrix[self.rowsAvailable[i]][self.colsAvailable[j]] < least:
-					least = self.matrix[self.rowsAvailable[i]][self.colsAvailable[j]]
-					# if the least is now 0, we know we cannot find better
-					if least == 0:
-						break
-				
-			if least == 0:
-				continue
-			for j in range(0, len(self.colsAvailable)):
-				self.matrix[self.rowsAvailable[i]][self.colsAvailable[j]] -= least
-			self.lowerBound += least
-			# early break since if we got infinity, the rest doesnt' matter
-			if self.lowerBound == math.inf:
-				return math.inf
-		
-		# For each column
-		for i in range(len(self.colsAvailable)):
-			# choose some least to start out with
-			least = self.matrix[self.rowsAvailable[0]][self.colsAvailable[i]]
-			if least == 0:
-				continue
-			for j in range(1, len(self.rowsAvailable)):
-				# if the current index is less than least, replace it
-				if self.matrix[self.rowsAvailable[j]][self.colsAvailable[i]] < least:
-					least = self.matrix[self.rowsAvailable[j]][self.colsAvailable[i]]
-					# if the least is now 0, we know we cannot find better
-					if least == 0:
-						break
-				
-			if least == 0:
-				continue
-			for j in range(0, len(self.rowsAvailable)):
-				self.matrix[self.rowsAvailable[j]][self.colsAvailable[i]] -= least
-			self.lowerBound += least
-			# early break since if we got infinity, the rest doesn't matter
-			if self.lowerBound == math.inf:
-				return math.inf
-		
+		# There needs to be a zero in each row and column (see TSPKernels.reduceMatrix)
+		self.lowerBound += TSPKernels.reduceMatrix(self.matrix, self.rowsAvailable, self.colsAvailable)
 		return self.lowerBound
 	
 	
-	def select(self, nextCity):
+	def select(self, nextCity, edgeCost=0):
 		toReturn = copy.deepcopy(self)
 		# the current city is the last one on the path
 		currCity = toReturn.path[len(self.path)-1]
 		# choose the next city by adding the cost to lower bound
-		toReturn.lowerBound += toReturn.matrix[currCity][nextCity]
+		toReturn.lowerBound += toReturn.edge(currCity, nextCity)
 		
 		# then make some alterations to the matrix
 		# we set the row and column to unusable
@@ -548,21 +1195,332 @@ class CostMatrix:
 		toReturn.colsAvailable.remove(nextCity)
 		# we add this city to the path
 		toReturn.path.append(nextCity)
+		toReturn.pathCost += edgeCost
+		toReturn.visited |= 1 << nextCity
+		toReturn.expanded = 0
 		# and we block out the mirror
-		toReturn.matrix[nextCity][currCity] = math.inf
+		toReturn.matrix[nextCity][currCity] = NO_EDGE
 		
 		return toReturn
 	
 	
+	def edge(self, i, j):
+		# the reduced cost of i->j (inf if it is blocked)
+		entry = self.matrix[i][j]
+		return math.inf if entry == NO_EDGE else int(entry)
+	
+	
 	def getPathCities(self, cities):
 		return [cities[i] for i in self.path]
+	
+	
+	def memory(self):
+		# about how many bytes this state takes up
+		matrixBytes = self.matrix.nbytes if self.matrix is not None else 0
+		return matrixBytes + sys.getsizeof(self.path) + sys.getsizeof(self.rowsAvailable) + sys.getsizeof(self.colsAvailable)
+
+
+class StateReplay:
+	# Rebuilds branch and bound states from their paths (for resumeBranchAndBound) by
+	# making the same selections and reductions from the root that the search did. The
+	# states along the last path rebuilt are kept, because states tend to come off the
+	# frontier near their siblings, which then only need their last step made
+	def __init__(self, root, cost):
+		self.chain = [root]
+		self.cost = cost
+	
+	def state(self, path):
+		depth = 1
+		while depth < len(self.chain) and depth < len(path) and self.chain[depth].path[depth] == path[depth]:
+			depth += 1
+		del self.chain[depth:]
+		for d in range(depth, len(path)):
+			child = self.chain[-1].select(path[d], int(self.cost[path[d-1], path[d]]))
+			child.reduce()
+			self.chain.append(child)
+		return self.chain[-1]
 		
 
+class WorkingCostMatrix:
+	# A cost matrix which is changed in place (for the depth-first search) instead of being
+	# copied for every child. Every change is written to an undo log, and mark()/undo()
+	# roll the matrix back to how it was at the last mark. Rows and columns are never
+	# really removed, they are just flagged as not free anymore. Like the scenario's costs
+	# the matrix is int32 with NO_EDGE for blocked entries, which reductions leave alone.
+	def __init__(self, matrix, lowerBound):
+		self.matrix = np.array(matrix, dtype=np.int32)
+		self.rowFree = np.ones(len(self.matrix), dtype=bool)
+		self.colFree = np.ones(len(self.matrix), dtype=bool)
+		self.path = []
+		self.lowerBound = lowerBound
+		self.pathCost = 0 # the real cost of the path so far
+		self.visited = 0 # bitmask of the cities on the path
+		self.log = []
+		self.marks = []
+		self.logBytes = 0
+	
+	def openRows(self):
+		return np.flatnonzero(self.rowFree)
+	
+	def openCols(self):
+		return np.flatnonzero(self.colFree)
+	
+	def mark(self):
+		self.marks.append((len(self.log), self.lowerBound))
+	
+	def undo(self):
+		at, self.lowerBound = self.marks.pop()
+		while len(self.log) > at:
+			entry = self.log.pop()
+			if entry[0] == 'select':
+				_, currCity, nextCity, mirror, edgeCost = entry
+				self.matrix[nextCity, currCity] = mirror
+				self.pathCost -= edgeCost
+				self.visited &= ~(1 << int(nextCity))
+				self.rowFree[currCity] = True
+				self.colFree[nextCity] = True
+				self.path.pop()
+			else:
+				_, rows, cols, rowLeast, colLeast = entry
+				self.logBytes -= rows.nbytes + cols.nbytes + rowLeast.nbytes + colLeast.nbytes
+				# blocked entries were left alone, so adding the least back to the others
+				# restores every entry
+				block = np.ix_(rows, cols)
+				sub = self.matrix[block]
+				self.matrix[block] = np.where(sub == NO_EDGE, NO_EDGE, sub + rowLeast[:, None] + colLeast[None, :])
+	
+	def select(self, nextCity, edgeCost=0):
+		# the current city is the last one on the path
+		currCity = self.path[-1]
+		# choose the next city by adding the cost to lower bound
+		self.lowerBound += self.edge(currCity, nextCity)
+		# we set the row and column to unusable, add the city to the path, and block the mirror
+		self.log.append(('select', currCity, nextCity, self.matrix[nextCity, currCity], edgeCost))
+		self.rowFree[currCity] = False
+		self.colFree[nextCity] = False
+		self.path.append(nextCity)
+		self.pathCost += edgeCost
+		self.visited |= 1 << int(nextCity)
+		self.matrix[nextCity, currCity] = NO_EDGE
+	
+	def edge(self, i, j):
+		# the reduced cost of i->j (inf if it is blocked)
+		entry = self.matrix[i, j]
+		return math.inf if entry == NO_EDGE else int(entry)
+	
+	def reduce(self):
+		# There needs to be a zero in each row and column (the way TSPKernels.reduceMatrix
+		# does it, leaving NO_EDGE alone). What was taken off goes in the log
+		rows = np.flatnonzero(self.rowFree)
+		cols = np.flatnonzero(self.colFree)
+		block = np.ix_(rows, cols)
+		sub = self.matrix[block]
+		gone = sub == NO_EDGE
+		rowLeast = sub.min(axis=1)
+		if np.any(rowLeast == NO_EDGE):
+			self.lowerBound = math.inf
+			return math.inf
+		sub = np.where(gone, NO_EDGE, sub - rowLeast[:, None])
+		colLeast = sub.min(axis=0)
+		if np.any(colLeast == NO_EDGE):
+			self.lowerBound = math.inf
+			return math.inf
+		if not np.any(rowLeast) and not np.any(colLeast):
+			return self.lowerBound
+		self.matrix[block] = np.where(gone, NO_EDGE, sub - colLeast[None, :])
+		self.lowerBound += int(rowLeast.sum(dtype=np.int64) + colLeast.sum(dtype=np.int64))
+		self.log.append(('reduce', rows, cols, rowLeast, colLeast))
+		self.logBytes += rows.nbytes + cols.nbytes + rowLeast.nbytes + colLeast.nbytes
+		return self.lowerBound
+	
+	def memory(self):
+		return self.matrix.nbytes + self.logBytes
+
+
+class TranspositionTable:
+	# Remembers the cheapest path cost seen for each (visited cities, current city) state, so
+	# that branch and bound can drop states that got to the same place the expensive way.
+	# It only holds capacity states; when it is full, the least recently used is evicted.
+	def __init__(self, capacity):
+		self.capacity = capacity
+		self.best = collections.OrderedDict()
+		self.hits = 0 # lookups that found the state
+		self.pruned = 0 # states dropped because a cheaper way was known
+		self.evicted = 0
+	
+	def dominated(self, visited, city, pathCost):
+		# called when a state is created. True if there is a way to this state that is at
+		# least as cheap, otherwise this becomes the cheapest way
+		if self.capacity <= 0:
+			return False
+		key = (visited, int(city))
+		known = self.best.get(key)
+		if known is not None:
+			self.hits += 1
+			self.best.move_to_end(key)
+			if known <= pathCost:
+				self.pruned += 1
+				return True
+		self.best[key] = pathCost
+		self.best.move_to_end(key)
+		if len(self.best) > self.capacity:
+			self.best.popitem(last=False)
+			self.evicted += 1
+		return False
+	
+	def beaten(self, visited, city, pathCost):
+		# called when a state is about to be expanded. True if a strictly cheaper way to
+		# the state turned up after it was created
+		if self.capacity <= 0:
+			return False
+		known = self.best.get((visited, int(city)))
+		if known is not None and known < pathCost:
+			self.hits += 1
+			self.pruned += 1
+			return True
+		return False
+
+
+def orderChildren(matrix, rows, cols, cityAt, order):
+	# the cities we can go to next from cityAt (never back to city 0 until the very end),
+	# in the order we want to make the children:
+	# 'column': in column order
+	# 'cost': cheapest reduced edge first
+	# 'regret': most expensive to leave out first. Leaving out cityAt->c costs at least
+	#   the cheapest other edge out of cityAt plus the cheapest other edge into c (Little)
+	matrix = floatView(np.asarray(matrix))
+	cols = np.asarray(cols)
+	cols = cols[cols != 0]
+	edges = matrix[cityAt, cols]
+	cols, edges = cols[edges < math.inf], edges[edges < math.inf]
+	if order == 'column' or len(cols) < 2:
+		return [int(c) for c in cols]
+	if order == 'cost':
+		return [int(c) for c in cols[np.argsort(edges, kind='stable')]]
+	if order == 'regret':
+		rows = np.asarray(rows)
+		# cheapest other way out of cityAt: the smallest entry of the row that isn't c
+		firstTwo = np.partition(edges, 1)[:2]
+		outOther = np.where(edges == firstTwo[0], firstTwo[1], firstTwo[0])
+		# cheapest other way into c: the smallest entry of the column from another row
+		into = matrix[np.ix_(rows[rows != cityAt], cols)]
+		inOther = into.min(axis=0) if len(into) > 0 else np.full(len(cols), math.inf)
+		with np.errstate(invalid='ignore'):
+			regret = outOther + inOther - edges
+		regret[np.isnan(regret)] = math.inf
+		return [int(c) for c in cols[np.argsort(-regret, kind='stable')]]
+	raise Exception('Unknown child order: {}'.format(order))
+
+
+class EdgeState:
+	# A state of edgeBranchBB: the reduced matrix (int32, where the rows and columns of
+	# included edges are all NO_EDGE), its lower bound, and the included edges as
+	# successor/predecessor arrays
+	def __init__(self, matrix, lowerBound):
+		self.matrix = np.array(matrix, dtype=np.int32)
+		self.lowerBound = lowerBound
+		n = len(self.matrix)
+		self.succ = np.full(n, -1)
+		self.pred = np.full(n, -1)
+		self.included = 0
+	
+	def copy(self):
+		other = EdgeState.__new__(EdgeState)
+		other.matrix = self.matrix.copy()
+		other.lowerBound = self.lowerBound
+		other.succ = self.succ.copy()
+		other.pred = self.pred.copy()
+		other.included = self.included
+		return other
+	
+	def edge(self, i, j):
+		# the reduced cost of i->j (inf if it is blocked)
+		entry = self.matrix[i, j]
+		return math.inf if entry == NO_EDGE else int(entry)
+	
+	def branchEdge(self):
+		# the zero entry with the highest penalty, or None if nothing is left to branch on
+		free = self.matrix != NO_EDGE
+		if not np.any(free):
+			return None
+		rowsLeft = np.flatnonzero(free.any(axis=1))
+		colsLeft = np.flatnonzero(free.any(axis=0))
+		sub = self.matrix[np.ix_(rowsLeft, colsLeft)]
+		# the second smallest of each row and column (0 if there is another zero). A
+		# NO_EDGE there counts as the biggest penalty, like inf would
+		rowSecond = np.partition(sub, 1, axis=1)[:, 1] if sub.shape[1] > 1 else np.full(len(rowsLeft), NO_EDGE)
+		colSecond = np.partition(sub, 1, axis=0)[1, :] if sub.shape[0] > 1 else np.full(len(colsLeft), NO_EDGE)
+		zi, zj = np.nonzero(sub == 0)
+		if len(zi) == 0:
+			return None
+		# as int64, so two NO_EDGEs do not wrap around
+		penalty = rowSecond[zi].astype(np.int64) + colSecond[zj]
+		k = int(np.argmax(penalty))
+		return int(rowsLeft[zi[k]]), int(colsLeft[zj[k]])
+	
+	def include(self, i, j):
+		child = self.copy()
+		child.lowerBound += child.edge(i, j)
+		child.matrix[i, :] = NO_EDGE
+		child.matrix[:, j] = NO_EDGE
+		child.succ[i] = j
+		child.pred[j] = i
+		child.included += 1
+		if child.included < len(child.matrix) - 1:
+			# block the edge from the end of j's chain back to the start of i's chain,
+			# which would close a cycle that isn't the whole tour
+			head = i
+			while child.pred[head] >= 0:
+				head = child.pred[head]
+			tail = j
+			while child.succ[tail] >= 0:
+				tail = child.succ[tail]
+			child.matrix[tail, head] = NO_EDGE
+		elif child.included == len(child.matrix) - 1:
+			# only one edge is left, and it has to close the tour
+			tail = int(np.flatnonzero(child.succ < 0)[0])
+			head = int(np.flatnonzero(child.pred < 0)[0])
+			child.lowerBound += child.edge(tail, head)
+			child.succ[tail] = head
+			child.pred[head] = tail
+			child.included += 1
+			return child
+		child.reduce()
+		return child
+	
+	def exclude(self, i, j):
+		child = self.copy()
+		child.matrix[i, j] = NO_EDGE
+		child.reduce()
+		return child
+	
+	def reduce(self):
+		# There needs to be a zero in each row and column that is still open
+		self.lowerBound += TSPKernels.reduceMatrix(self.matrix, np.flatnonzero(self.succ < 0),
+												   np.flatnonzero(self.pred < 0))
+		return self.lowerBound
+	
+	def route(self):
+		route = [0]
+		while len(route) < len(self.succ):
+			route.append(int(self.succ[route[-1]]))
+		return route
+
+
+def makeFrontier(strategy, memoryBudget):
+	if strategy == 'robin':
+		return RobinQueue()
+	if strategy in ('best', 'depth', 'hybrid'):
+		return StrategyQueue(strategy, memoryBudget)
+	raise Exception('Unknown branch and bound strategy: {}'.format(strategy))
+
+
 class RobinQueue:
 	def __init__(self):
 		self.levels = [] # a list of lists for the elements on each level
 		self.l_on = 0 # the current level we are on
 		self.size = 0 # the number of elements in the queue
+		self.bytes = 0 # about how much memory the elements take up
 	
 	def getNext(self):
 		if self.size <= 0:
@@ -586,94 +1544,1086 @@ class RobinQueue:
 		# now we can actually pop the chosen one
 		self.levels[self.l_on].remove(cheapest)
 		self.size -= 1
+		self.bytes -= cheapest.memory()
 		return cheapest
 	
 	def insert(self, matrix):
 		self.size += 1
+		self.bytes += matrix.memory()
 		levelOn = len(matrix.path) - 1
 		while len(self.levels) <= levelOn:
 			self.levels.append([])
 		self.levels[levelOn].append(matrix)
 		return
+	
+	def states(self):
+		# everything on the frontier
+		for level in self.levels:
+			for matrix in level:
+				yield matrix
+
+
+class StrategyQueue:
+	# Frontier for the 'best', 'depth' and 'hybrid' strategies. Like RobinQueue it keeps
+	# a level per path length, but each level is a heap on the lower bound. Best-first takes
+	# the cheapest top of all the levels; depth-first takes the top of the deepest level
+	# (so the cheapest child of the latest expansion). Hybrid is best-first while the
+	# frontier fits in the memory budget and depth-first while it does not.
+	def __init__(self, strategy, memoryBudget):
+		self.strategy = strategy
+		self.memoryBudget = memoryBudget
+		self.levels = [] # a heap of (lowerBound, tiebreak, matrix) for each level
+		self.size = 0 # the number of elements in the queue
+		self.bytes = 0 # about how much memory the elements take up
+		self.inserted = 0 # keeps the heaps from comparing matrices on ties
+	
+	def getNext(self):
+		if self.size <= 0:
+			raise Exception("There are no elements to get!")
+		if self.strategy == 'depth' or (self.strategy == 'hybrid' and self.bytes > self.memoryBudget):
+			level = len(self.levels) - 1
+			while len(self.levels[level]) == 0:
+				level -= 1
+		else:
+			level = None
+			for l in range(len(self.levels)):
+				if len(self.levels[l]) > 0 and (level is None or self.levels[l][0] < self.levels[level][0]):
+					level = l
+		matrix = heapq.heappop(self.levels[level])[2]
+		# drop empty levels off the top so that the deepest is easy to find
+		while len(self.levels) > 0 and len(self.levels[-1]) == 0:
+			self.levels.pop()
+		self.size -= 1
+		self.bytes -= matrix.memory()
+		return matrix
+	
+	def insert(self, matrix):
+		self.size += 1
+		self.bytes += matrix.memory()
+		self.inserted += 1
+		levelOn = len(matrix.path) - 1
+		while len(self.levels) <= levelOn:
+			self.levels.append([])
+		heapq.heappush(self.levels[levelOn], (matrix.lowerBound, -self.inserted, matrix))
+		return
+	
+	def states(self):
+		# everything on the frontier
+		for level in self.levels:
+			for entry in level:
+				yield entry[2]
 #########################################################
 
 
-def initialize(cities):
-	startCity = None
-	fewest = math.inf
-	connections = [[] for _ in range(len(cities))]
-	for i in range(len(cities)):
-		for route in range(len(cities)):
-			if cities[i] is cities[route]:  # skip paths to ourself
+class HamiltonSearch:
+	# Search for a Hamiltonian cycle (any valid tour) on the edge existence matrix, in two
+	# phases. First a backtracking search, where next cities are tried Warnsdorff-style
+	# (fewest onward options first, ties broken by cost). We keep, for every city, how many
+	# ways in and ways out it still has, and prune as soon as some unvisited city runs out
+	# of either one. All of that bookkeeping is on numpy arrays, so a step is O(degree).
+	# On dense graphs this finds a tour right away; on very sparse ones it tends to get
+	# stuck deep in the tree, so after a backtrack budget we switch to cycle patching: pick
+	# a random perfect matching of out-edges to in-edges (a cover of the cities by disjoint
+	# cycles), then merge cycles two at a time wherever the edges for the swap exist.
+	BACKTRACK_BUDGET = 20 # backtracks per city before giving up on the first phase
+	
+	def __init__(self, edgeExists, cost):
+		self.n = len(edgeExists)
+		self.edgeExists = edgeExists
+		self.cost = cost
+		if isinstance(edgeExists, SparseEdges):
+			# the graph knows its edges, so we don't have to look through every row for them
+			self.succ = [edgeExists.successors(i) for i in range(self.n)]
+			self.pred = [edgeExists.predecessors(i) for i in range(self.n)]
+		else:
+			self.succ = [np.flatnonzero(edgeExists[i]) for i in range(self.n)]
+			self.pred = [np.flatnonzero(edgeExists[:, i]) for i in range(self.n)]
+		self.steps = 0
+		self.backtracks = 0
+		self.pruned = 0
+		self.deepest = 0
+		self.covers = 0
+		self.failure = None
+	
+	def run(self, deadline):
+		n = self.n
+		if n == 1:
+			return [0]
+		inDeg = np.array([len(p) for p in self.pred])
+		outDeg = np.array([len(s) for s in self.succ])
+		if np.any(inDeg == 0) or np.any(outDeg == 0):
+			bad = int(np.flatnonzero((inDeg == 0) | (outDeg == 0))[0])
+			self.failure = 'city {} has no {} edges, so no tour exists'.format(
+				bad, 'incoming' if inDeg[bad] == 0 else 'outgoing')
+			return None
+		route = self.backtrackSearch(deadline, inDeg, outDeg)
+		if route is not None or self.failure is not None:
+			return route
+		route = self.patchSearch(deadline)
+		if route is None and self.failure is None:
+			self.failure = 'no tour found within the time allowance ({} backtracks, deepest path {} ' \
+						   'of {} cities, {} cycle covers patched)'.format(self.backtracks, self.deepest, n, self.covers)
+		return route
+	
+	def backtrackSearch(self, deadline, inDeg, outDeg):
+		# returns the route, or None with self.failure set if there cannot be one, or just
+		# None if we ran out of time or backtracks
+		n = self.n
+		# start where we have the fewest options
+		start = int(np.argmin(np.minimum(inDeg, outDeg)))
+		self.start = start
+		self.unvisited = np.ones(n, dtype=bool)
+		self.unvisited[start] = False
+		# ways in come from unvisited cities or the current city; ways out go to unvisited
+		# cities or back to the start. At the beginning, that is every edge
+		self.inAvail = inDeg.copy()
+		self.outAvail = outDeg.copy()
+		
+		path = [start]
+		stack = [self.candidates(start)]
+		while len(stack) > 0:
+			if time.time() > deadline or self.backtracks > self.BACKTRACK_BUDGET * n:
+				return None
+			if len(path) == n:
+				if self.edgeExists[path[-1], start]:
+					return path
+				# the last city cannot get home
+				self.backtrack(path, stack)
 				continue
-			dist = cities[route].costTo(cities[i])
-			if dist == math.inf:  # verify that it is a valid path
+			cands, at = stack[-1]
+			if at >= len(cands):
+				self.backtrack(path, stack)
 				continue
-			# This is a digraph, so the connections are unidirectional
-			connections[route].append(i)
-
-		if len(connections[i]) < fewest:
-			fewest = len(connections[i])
-			startCity = i
-	return startCity, connections
-
-
-def secureGreedy(connections, startCity, cities):
-	used = [False] * len(cities)
-	usedLen = len(cities)
-
-	banned_edges = [[] for _ in range(len(cities))]
-	path = [startCity]
-
-	foundTour = False
-	current = startCity
-	backtrack = False
-	while usedLen > 0:
-		used[current] = True
-		usedLen -= 1
-		if usedLen == 0:
-			if startCity in connections[current]:
-				foundTour = True
+			stack[-1] = (cands, at + 1)
+			nxt = int(cands[at])
+			self.steps += 1
+			if not self.advance(path[-1], nxt):
+				self.pruned += 1
+				continue
+			path.append(nxt)
+			self.deepest = max(self.deepest, len(path))
+			stack.append(self.candidates(nxt))
+		self.failure = 'the search was exhausted: there is no Hamiltonian cycle in this graph'
+		return None
+	
+	def candidates(self, city):
+		succ = self.succ[city]
+		cands = succ[self.unvisited[succ]]
+		# a city whose only way in left is from here has to be next
+		forced = cands[self.inAvail[cands] == 1]
+		if len(forced) > 0:
+			return forced[:1] if len(forced) == 1 else forced[:0], 0
+		order = np.lexsort((self.cost[city, cands], self.outAvail[cands]))
+		return cands[order], 0
+	
+	def advance(self, cur, nxt):
+		# move from cur to nxt, updating the counts. If that leaves a dead end, undo it and
+		# report False
+		self.unvisited[nxt] = False
+		# cur is no longer a way in for anything
+		self.inAvail[self.succ[cur]] -= 1
+		# nxt is no longer a way out for anything (it is not unvisited anymore)
+		self.outAvail[self.pred[nxt]] -= 1
+		ok = True
+		if np.any(self.unvisited):
+			succ = self.succ[cur]
+			pred = self.pred[nxt]
+			if np.any(self.inAvail[succ[self.unvisited[succ]]] == 0) or \
+			   np.any(self.outAvail[pred[self.unvisited[pred]]] == 0) or \
+			   self.inAvail[self.start] == 0:
+				ok = False
+		if not ok:
+			self.retreat(cur, nxt)
+		return ok
+	
+	def retreat(self, cur, nxt):
+		self.outAvail[self.pred[nxt]] += 1
+		self.inAvail[self.succ[cur]] += 1
+		self.unvisited[nxt] = True
+	
+	def backtrack(self, path, stack):
+		self.backtracks += 1
+		stack.pop()
+		last = path.pop()
+		if len(path) > 0:
+			self.retreat(path[-1], last)
+	
+	def patchSearch(self, deadline):
+		rng = np.random.default_rng(self.n)
+		while time.time() < deadline:
+			succ = self.cycleCover(rng)
+			if succ is None:
+				return None
+			self.covers += 1
+			if self.patch(succ):
+				route = [0]
+				while len(route) < self.n:
+					route.append(succ[route[-1]])
+				return route
+		return None
+	
+	def cycleCover(self, rng):
+		# random perfect matching from each city to a successor, by augmenting paths
+		n = self.n
+		matchOut = [-1] * n
+		matchIn = [-1] * n
+		adj = [list(rng.permutation(s)) for s in self.succ]
+		for u in rng.permutation(n):
+			# breadth first search for an augmenting path from u
+			prev = {}
+			queue = [u]
+			found = -1
+			at = 0
+			while at < len(queue) and found < 0:
+				x = queue[at]
+				at += 1
+				for v in adj[x]:
+					if v in prev:
+						continue
+					prev[v] = x
+					if matchIn[v] < 0:
+						found = v
+						break
+					queue.append(matchIn[v])
+			if found < 0:
+				self.failure = 'no cycle cover exists (city {} cannot get its own successor), ' \
+							   'so there is no Hamiltonian cycle in this graph'.format(u)
+				return None
+			# flip the path
+			v = found
+			while True:
+				x = prev[v]
+				after = matchOut[x]
+				matchOut[x] = v
+				matchIn[v] = x
+				if x == u:
+					break
+				v = after
+		return matchOut
+	
+	def patch(self, succ):
+		# merge cycles a->succ[a], b->succ[b] into one by a->succ[b], b->succ[a] while we can
+		n = self.n
+		while True:
+			cycle = [-1] * n
+			count = 0
+			for i in range(n):
+				if cycle[i] < 0:
+					j = i
+					while cycle[j] < 0:
+						cycle[j] = count
+						j = succ[j]
+					count += 1
+			if count == 1:
+				return True
+			merged = False
+			for a in range(n):
+				for b in self.pred[succ[a]]:
+					if cycle[b] != cycle[a] and self.edgeExists[a, succ[b]]:
+						succ[a], succ[b] = succ[b], succ[a]
+						merged = True
+						break
+				if merged:
+					break
+			if not merged:
+				return False
+
+
+def candidateNearestNeighbor(scenario, candidates, start):
+	# the nearest-neighbor tour from start without a cost matrix: the next city is the
+	# cheapest unvisited one of the current city's candidates (see Scenario.getCandidates),
+	# and only once those are all visited are the costs to every unvisited city worked out
+	# (see Scenario._costBlock). Returns the route and its cost, or (None, inf) if it got
+	# stuck or the last city has no edge back to start
+	n = len(candidates)
+	rows = np.arange(n)[:, None]
+	candCost = scenario._costPairs(rows, np.maximum(candidates, 0))
+	visited = np.zeros(n, dtype=bool)
+	visited[start] = True
+	route = [start]
+	total = 0
+	cur = start
+	for _ in range(n - 1):
+		nxt = -1
+		for k, c in enumerate(candidates[cur]):
+			if c >= 0 and not visited[c]:
+				nxt, edge = int(c), int(candCost[cur, k])
 				break
+		if nxt < 0:
+			left = np.flatnonzero(~visited)
+			costs = scenario._costBlock(np.array([cur]), left)[0]
+			best = int(np.argmin(costs))
+			if costs[best] == NO_EDGE:
+				return None, math.inf
+			nxt, edge = int(left[best]), int(costs[best])
+		visited[nxt] = True
+		route.append(nxt)
+		total += edge
+		cur = nxt
+	back = scenario._costBlock(np.array([cur]), np.array([start]))[0, 0]
+	if back == NO_EDGE:
+		return None, math.inf
+	return route, total + int(back)
+
+
+def hilbertIndex(xs, ys, order=16):
+	# position of every point along a Hilbert curve of the given order over the bounding box
+	side = 1 << order
+	span = max(xs.max() - xs.min(), ys.max() - ys.min(), 1e-12)
+	x = ((xs - xs.min()) / span * (side - 1)).astype(np.int64)
+	y = ((ys - ys.min()) / span * (side - 1)).astype(np.int64)
+	d = np.zeros(len(xs), dtype=np.int64)
+	s = side >> 1
+	while s > 0:
+		rx = (x & s) > 0
+		ry = (y & s) > 0
+		d += s * s * ((3 * rx) ^ ry)
+		# rotate the quadrant so that the curve lines up
+		flip = ~ry & rx
+		x = np.where(flip, side - 1 - x, x)
+		y = np.where(flip, side - 1 - y, y)
+		swap = ~ry
+		x, y = np.where(swap, y, x), np.where(swap, x, y)
+		s >>= 1
+	return d
+
+
+def insertionTour(cost, farthest, deadline):
+	# Build a tour by insertion. The tour is kept as a successor array, and for every city
+	# not yet in it we keep its best insertion (cost and the tour edge a->succ[a] to break).
+	# Inserting x into a->b only removes that one edge and adds a->x and x->b, so the other
+	# cities only need to be checked against those two new edges (vectorized), except for
+	# the few whose best edge was a->b, which get a full rescan. For cheapest insertion the
+	# candidates sit in a heap keyed by insertion cost; stale entries are skipped when popped.
+	# For farthest insertion the key is the distance to the tour (a max-heap).
+	# Returns the route as a list of city indices, or None if some city could not be inserted.
+	n = len(cost)
+	if n == 1:
+		return [0]
+	cost = floatView(cost)
+	succ = np.full(n, -1)
+	inTour = np.zeros(n, dtype=bool)
+	# start from the pair with the cheapest (or most expensive) round trip
+	whole = cost[:, :]
+	with np.errstate(invalid='ignore'):
+		roundTrip = whole + whole.T
+	if farthest:
+		roundTrip = np.where(np.isfinite(roundTrip), roundTrip, -1.0)
+		first, second = np.unravel_index(np.argmax(roundTrip), roundTrip.shape)
+		if roundTrip[first, second] < 0:
+			return None
+	else:
+		first, second = np.unravel_index(np.argmin(roundTrip), roundTrip.shape)
+		if roundTrip[first, second] == math.inf:
+			return None
+	succ[first] = second
+	succ[second] = first
+	inTour[[first, second]] = True
+	
+	bestCost = np.full(n, math.inf)
+	bestEdge = np.full(n, -1)
+	# distance of every city to the tour (only used by farthest insertion)
+	toTour = np.minimum(np.minimum(cost[first], cost[second]), np.minimum(cost[:, first], cost[:, second]))
+	
+	def rescan(city):
+		a = np.flatnonzero(inTour)
+		with np.errstate(invalid='ignore'):
+			added = cost[a, city] + cost[city, succ[a]] - cost[a, succ[a]]
+		added[np.isnan(added)] = math.inf
+		j = int(np.argmin(added))
+		bestCost[city] = added[j]
+		bestEdge[city] = a[j]
+	
+	heap = []
+	for city in range(n):
+		if not inTour[city]:
+			rescan(city)
+			heap.append((-toTour[city] if farthest else bestCost[city], city))
+	heapq.heapify(heap)
+	
+	inserted = 2
+	while inserted < n:
+		if time.time() > deadline or len(heap) == 0:
+			return None
+		key, x = heapq.heappop(heap)
+		if inTour[x]:
+			continue
+		# skip stale keys (they only get pushed again when they changed)
+		if (farthest and -key != toTour[x]) or (not farthest and key != bestCost[x]):
+			continue
+		if bestCost[x] == math.inf:
+			# nowhere to put the city (yet). In cheapest mode nothing else fits either
+			if not farthest:
+				return None
+			continue
+		a = bestEdge[x]
+		b = succ[a]
+		succ[a] = x
+		succ[x] = b
+		inTour[x] = True
+		inserted += 1
+		
+		out = np.flatnonzero(~inTour)
+		if len(out) == 0:
+			break
+		# check the two new edges a->x and x->b for everybody still out
+		with np.errstate(invalid='ignore'):
+			viaAX = cost[a, out] + cost[out, x] - cost[a, x]
+			viaXB = cost[x, out] + cost[out, b] - cost[x, b]
+		viaAX[np.isnan(viaAX)] = math.inf
+		viaXB[np.isnan(viaXB)] = math.inf
+		stale = bestEdge[out] == a
+		better = (np.minimum(viaAX, viaXB) < bestCost[out]) & ~stale
+		improved = out[better]
+		useAX = viaAX[better] <= viaXB[better]
+		bestCost[improved] = np.where(useAX, viaAX[better], viaXB[better])
+		bestEdge[improved] = np.where(useAX, a, x)
+		for city in out[stale]:
+			rescan(city)
+		if farthest:
+			closer = np.minimum(cost[x, out], cost[out, x])
+			moved = out[closer < toTour[out]]
+			toTour[moved] = closer[closer < toTour[out]]
+			# cities which were waiting on an edge get another chance as well
+			changed = np.union1d(moved, np.union1d(improved, out[stale]))
+			for city in changed:
+				heapq.heappush(heap, (-toTour[city], int(city)))
+		else:
+			for city in np.union1d(improved, out[stale]):
+				heapq.heappush(heap, (bestCost[city], int(city)))
+	
+	route = [int(first)]
+	while len(route) < n:
+		route.append(int(succ[route[-1]]))
+	return route
+
+
+def cheapestInsertion(route, toInsert, cost):
+	# put every city of toInsert into the route (a list of city indices) where it costs
+	# the least, cheapest city first. Returns None if some city cannot be inserted anywhere
+	route = list(route)
+	toInsert = list(toInsert)
+	cost = floatView(cost)
+	if len(route) == 0 and len(toInsert) > 0:
+		route.append(toInsert.pop())
+	if len(toInsert) == 0:
+		return route
+	
+	def insertCosts(loose, a, b):
+		# cost of putting each loose city between a[j] and b[j] (as a column per j)
+		with np.errstate(invalid='ignore'):
+			added = cost[np.ix_(loose, b)] + cost[np.ix_(a, loose)].T
+			if len(route) > 1:
+				added -= cost[a, b][None, :]
+		added[np.isnan(added)] = math.inf
+		return added
+	
+	arr = np.array(route)
+	loose = np.array(toInsert)
+	# added[k, j] is the cost of putting loose[k] between route[j] and route[j+1]. We only
+	# build it once: each insertion just swaps the broken edge's column for two new ones
+	added = insertCosts(loose, arr, np.roll(arr, -1))
+	while len(loose) > 0:
+		k, j = np.unravel_index(np.argmin(added), added.shape)
+		if added[k, j] == math.inf:
+			return None
+		city = int(loose[k])
+		a = route[j]
+		b = route[(j + 1) % len(route)]
+		route.insert(j + 1, city)
+		loose = np.delete(loose, k)
+		added = np.delete(added, k, axis=0)
+		if len(route) == 2:
+			# the single edge a->a became a->city->a
+			added = insertCosts(loose, np.array(route), np.array(route[::-1]))
+			continue
+		fresh = insertCosts(loose, np.array([a, city]), np.array([city, b]))
+		added = np.concatenate((added[:, :j], fresh, added[:, j+1:]), axis=1)
+	return route
+
+
+def orOpt(route, cost, focus, deadline, segLimit=3):
+	# or-opt local search: move segments of up to segLimit cities to a cheaper place in the
+	# tour without reversing them (so it is safe for asymmetric costs). Only segments which
+	# start at a city in focus are tried, and any city next to a change is queued up again.
+	# Returns the improved route and the number of moves applied.
+	route = list(route)
+	n = len(route)
+	moves = 0
+	if n < 5:
+		return route, moves
+	cost = floatView(cost)
+	queue = list(focus)
+	queued = set(queue)
+	while len(queue) > 0 and time.time() < deadline:
+		city = queue.pop()
+		queued.discard(city)
+		i = route.index(city)
+		for length in range(1, segLimit + 1):
+			if length > n - 3:
+				break
+			arr = np.array(route)
+			seg = [(i + k) % n for k in range(length)]
+			p = arr[i-1]
+			q = arr[(i + length) % n]
+			first = arr[seg[0]]
+			last = arr[seg[-1]]
+			# what we save by taking the segment out and closing the gap
+			gain = cost[p, first] + cost[last, q] - cost[p, q]
+			if not gain > 0:
+				continue
+			after = np.roll(arr, -1)
+			with np.errstate(invalid='ignore'):
+				delta = cost[arr, first] + cost[last, after] - cost[arr, after] - gain
+			# we cannot insert the segment next to (or inside) itself
+			for k in range(-1, length):
+				delta[(i + k) % n] = math.inf
+			j = int(np.argmin(delta))
+			if not delta[j] < 0:
+				continue
+			# move the segment to sit between arr[j] and after[j]
+			segCities = [route[k] for k in seg]
+			rest = [route[(i + length + k) % n] for k in range(n - length)]
+			pos = rest.index(arr[j])
+			route = rest[:pos+1] + segCities + rest[pos+1:]
+			moves += 1
+			for c in (p, q, arr[j], after[j], first, last):
+				if c not in queued:
+					queue.append(c)
+					queued.add(c)
+			break
+	return route, moves
+
+
+def localSearch(route, cost, deadline, neighborhood='skip', iterate=False, candidates=None, window=None):
+	# The local search of fancy, from route until it converges (or the deadline): either
+	# skip-ahead moves or, with neighborhood='or3opt', segment swaps (see orThreeOpt). With
+	# a window size, every stretch of that many cities is then put in its best order (see
+	# windowSearch; each window improved counts as a move). Last comes iterated local
+	# search until the deadline if iterate (see iteratedLocalSearch). candidates are needed
+	# for or3opt and iterate. Returns the route, the number of moves, and the number of
+	# kicks made and kept.
+	route = np.array(route)
+	n = len(route)
+	moves = 0
+	if neighborhood == 'or3opt':
+		route, moves = orThreeOpt(route, cost, candidates, deadline)
+	elif neighborhood != 'skip':
+		raise ValueError('unknown neighborhood: ' + str(neighborhood))
+	
+	# This is what we call "skip-ahead" optimizations
+	# ------------------------------------------
+	i = 0
+	# after a move we keep going from the same spot instead of starting over at 0. Once we
+	# have gone all the way around without an alteration, we have converged
+	unchanged = 0 if neighborhood == 'skip' else n
+	while unchanged < n and time.time() < deadline:
+		# all of the skips from i are priced at once (see bestSkipMove), and we take the best
+		move = bestSkipMove(route, cost, i)
+		if move is not None:
+			kind, skipIndex = move
+			if kind == 'reverse':
+				# turn the stretch from i+1 to skipIndex around
+				reverseSegment(route, i+1, skipIndex)
 			else:
-				backtrack = True
-		next = 0 # the city index that we should go to next
-		cheapest = None
-		if not backtrack:
-			for i in range(len(connections[current])):
-				if used[connections[current][i]] or connections[current][i] in banned_edges[current]:
+				# pull skipIndex up to right after i
+				rotateSegment(route, i+1, skipIndex)
+			moves += 1
+			unchanged = 0
+		else:
+			unchanged += 1
+			i = (i + 1) % n
+	
+	if window is not None:
+		route, improved = windowSearch(route, cost, window, deadline)
+		moves += improved
+	
+	kicks = kept = 0
+	if iterate:
+		route, kicks, kept = iteratedLocalSearch(route, cost, candidates, deadline)
+	return route, moves, kicks, kept
+
+
+def windowSearch(route, cost, k, deadline):
+	# Exact re-optimization of short stretches of the tour: each window of k cities in a
+	# row is put in its best order between the two cities around it (which stay put), with
+	# the subset DP of TSPKernels.bestPaths. Windows that start k+1 apart only share those
+	# fixed end cities, so all of them around the tour go to the kernel as one batch; then
+	# the windows slide on by one city, until a whole slide of k+1 finds nothing better.
+	# Returns the route and the number of windows improved.
+	route = np.array(route)
+	n = len(route)
+	if k < 2 or n < k + 2:
+		return [int(c) for c in route], 0
+	if k > 16:
+		raise ValueError('windows of more than 16 cities are too big for the DP')
+	cost = floatView(cost)
+	span = np.arange(k + 2)
+	improved = 0
+	quiet = 0
+	offset = 0
+	while quiet <= k and time.time() < deadline:
+		at = (offset + (k + 1) * np.arange(n // (k + 1)))[:, None] + span
+		at %= n
+		windows = route[at]
+		blocks = cost[windows[:, :, None], windows[:, None, :]]
+		orders, best = TSPKernels.bestPaths(blocks)
+		now = blocks[:, span[:-1], span[1:]].sum(axis=1)
+		better = np.flatnonzero(best < now)
+		if len(better) > 0:
+			route[at[better]] = np.take_along_axis(windows[better], orders[better], axis=1)
+			improved += len(better)
+			quiet = 0
+		else:
+			quiet += 1
+		offset = (offset + 1) % (k + 1)
+	return [int(c) for c in route], improved
+
+
+def orThreeOpt(route, cost, candidates, deadline, focus=None):
+	# Or-3opt local search (see OrThreeOpt) from the cities in focus, or all of them if
+	# None. Returns the improved route and the number of moves applied.
+	engine = OrThreeOpt(route, cost, candidates)
+	engine.push(route if focus is None else focus)
+	moves = engine.run(deadline)
+	return engine.route(), moves
+
+
+class OrThreeOpt:
+	# Or-3opt: swap two neighboring segments of the tour without turning either around.
+	# With the tour a -> [b..c] -> [d..e] -> f, the move drops a->b, c->d and e->f and adds
+	# a->d, e->b and c->f, giving a -> [d..e] -> [b..c] -> f. Every edge keeps its
+	# direction, so no backward costs are ever summed, which is what asymmetric (and
+	# thinned) graphs need. Moves are found from the candidate lists (see
+	# Scenario.getCandidates): d must be a candidate of a that is cheaper than a->b, and f
+	# a candidate of c cheaper than what is left of that gain; both lists are sorted, so
+	# the scans stop early. Cities are queued like don't-look bits: only queued cities are
+	# tried, and the ends of every move are queued again. The tour is a TwoLevelTour, where
+	# a swap is three flips of O(sqrt(n)) each. Costs are the integer ones of
+	# getCostMatrix; change adds up what the swaps did to the tour cost, and with a log
+	# every swap is remembered so that they can be undone.
+	def __init__(self, route, cost, candidates):
+		self.tour = TSPTour.TwoLevelTour(route)
+		self.cost = cost
+		self.cand = [[int(x) for x in row if x >= 0] for row in candidates]
+		self.queue = []
+		self.queued = set()
+		self.change = 0
+		self.log = None
+	
+	def push(self, cities):
+		for city in cities:
+			city = int(city)
+			if city not in self.queued:
+				self.queue.append(city)
+				self.queued.add(city)
+	
+	def run(self, deadline):
+		# apply improving swaps until the queue runs dry. Returns the number applied
+		if len(self.tour) < 5:
+			return 0
+		moves = 0
+		while len(self.queue) > 0 and time.time() < deadline:
+			a = self.queue.pop()
+			self.queued.discard(a)
+			move = self.findMove(a)
+			if move is not None:
+				self.swap(*move)
+				moves += 1
+				self.push(move)
+		return moves
+	
+	def findMove(self, a):
+		# the first improving swap whose first dropped edge leaves a, as (a, b, c, d, e, f)
+		tour = self.tour
+		cost = self.cost
+		b = tour.next(a)
+		ab = int(cost[a, b])
+		for d in self.cand[a]:
+			ad = int(cost[a, d])
+			if ad >= ab:
+				break
+			if d == b:
+				continue
+			c = tour.prev(d)
+			gain = ab + int(cost[c, d]) - ad # what a->d saves, left to pay for c->f and e->b
+			for f in self.cand[c]:
+				cf = int(cost[c, f])
+				if cf >= gain:
+					break
+				e = tour.prev(f)
+				# [d..e] has to end before we get back around to a
+				if e == a or not tour.between(d, e, a):
 					continue
-				if cheapest is None or cities[current].costTo(cities[connections[current][i]]) < cheapest:
-					cheapest = cities[current].costTo(cities[connections[current][i]])
-					next = connections[current][i]
-				elif cheapest == cities[current].costTo(cities[connections[current][i]]) and \
-						len(connections[connections[current][i]]) < len(connections[connections[current][next]]):
-					next = connections[current][i]
-			if cheapest == math.inf:
-				backtrack = True
-
-		if backtrack:
-			used[current] = False
-			usedLen += 2
-			if len(path) < 2:
-				return {'cost': math.inf} # we have to restart
-			banned_edges[path[-2]].append(current)
-			next = path[-2]
-			path = path[0:-2]
-			backtrack = False
-			# print("Back-Track")
-
-		path.append(next)
-		current = next
-	route = []
-	for i in path:
-		route.append(cities[i])
-	
-	bssf = TSPSolution(route)
-	results = {}
-	results['cost'] = bssf.cost if foundTour else math.inf
-	results['count'] = 1
-	results['soln'] = bssf
-	return results
-
-	
\ No newline at end of file
+				eb = int(cost[e, b])
+				if eb == NO_EDGE:
+					continue
+				if cf + eb - int(cost[e, f]) < gain:
+					return a, b, c, d, e, f
+		return None
+	
+	def swap(self, a, b, c, d, e, f):
+		# a [b..c] [d..e] f -> a [e..d] [c..b] f -> a [d..e] [c..b] f -> a [d..e] [b..c] f
+		cost = self.cost
+		self.change += int(cost[a, d]) + int(cost[e, b]) + int(cost[c, f]) \
+					   - int(cost[a, b]) - int(cost[c, d]) - int(cost[e, f])
+		self.tour.flip(a, b, e, f)
+		self.tour.flip(a, e, d, c)
+		self.tour.flip(e, c, b, f)
+		if self.log is not None:
+			self.log.append((a, b, c, d, e, f))
+	
+	def undo(self):
+		# take back every swap in the log, last first
+		log = self.log
+		self.log = None
+		for a, b, c, d, e, f in reversed(log):
+			self.swap(a, d, e, b, c, f)
+	
+	def route(self):
+		return self.tour.route()
+
+
+def iteratedLocalSearch(route, cost, candidates, deadline, kickLength=50):
+	# Iterated local search until the deadline. Each round kicks the tour with a double
+	# bridge: two neighboring stretches of up to kickLength cities, starting at a random
+	# city, trade places. That is an or-3opt swap, so it keeps every edge's direction and
+	# is fine for asymmetric costs. Then or-3opt runs from only the six cities at the
+	# kick's ends, and the round is kept if the tour is no worse than before, or else
+	# undone. Returns the route, the number of kicks and the number kept.
+	engine = OrThreeOpt(route, cost, candidates)
+	engine.push(route)
+	engine.run(deadline)
+	tour = engine.tour
+	n = len(tour)
+	kicks = 0
+	kept = 0
+	while n >= 8 and time.time() < deadline:
+		first = np.random.randint(1, min(kickLength, (n - 1) // 2) + 1)
+		second = np.random.randint(1, min(kickLength, n - 1 - first) + 1)
+		a = int(np.random.randint(n))
+		b = tour.next(a)
+		c = b
+		for _ in range(first - 1):
+			c = tour.next(c)
+		d = tour.next(c)
+		e = d
+		for _ in range(second - 1):
+			e = tour.next(e)
+		f = tour.next(e)
+		engine.change = 0
+		engine.log = []
+		engine.swap(a, b, c, d, e, f)
+		engine.push((a, b, c, d, e, f))
+		engine.run(deadline)
+		kicks += 1
+		if engine.change <= 0:
+			kept += 1
+			engine.log = None
+		else:
+			engine.queue = []
+			engine.queued = set()
+			engine.undo()
+	return engine.route(), kicks, kept
+
+
+def bestSkipMove(route, cost, i):
+	# Price every skip-ahead move from position i of the route at once, and give back the
+	# best one that improves the tour as ('reverse' or 'forward', skipIndex), or None.
+	# Looking from i (r is the route turned so that i is r[0]), skipping ahead to r[k]:
+	#  - reverse: i -> r[k] -> r[k-1] -> ... -> r[1] -> r[k+1], which trades the forward
+	#    edges r[0..k+1] for the backward edges r[k..1] plus the two new ends
+	#  - forward: i -> r[k] -> r[1] -> ... -> r[k-1] -> r[k+1], which only moves r[k]
+	# The forward and backward edge costs along the route are summed up once, so every
+	# k is a couple of array operations instead of a loop of costTo calls.
+	n = len(route)
+	if n < 4:
+		return None
+	cost = floatView(cost)
+	r = np.roll(route, -i)
+	after = np.roll(r, -1)
+	forward = cost[r, after] # forward[m] is r[m] -> r[m+1]
+	backward = cost[after, r] # backward[m] is r[m+1] -> r[m]
+	missing = backward == math.inf
+	# fwdSum[k] is forward[0] + ... + forward[k]. backSum[k] is backward[1] + ... + backward[k-1]
+	fwdSum = np.cumsum(forward)
+	backSum = np.concatenate(([0, 0], np.cumsum(np.where(missing, 0, backward)[1:])))
+	missSum = np.concatenate(([0, 0], np.cumsum(missing[1:])))
+	
+	k = np.arange(2, n)
+	rk = r[k]
+	rNext = after[k] # r[k+1], wrapping around to r[0]
+	jump = cost[r[0], rk] # the skip itself
+	with np.errstate(invalid='ignore'):
+		reverse = jump + backSum[k] + cost[r[1], rNext] - fwdSum[k]
+		forwardSkip = jump + cost[rk, r[1]] + cost[r[k-1], rNext] - forward[0] - forward[k-1] - forward[k]
+	# a reverse is only possible if every backward edge on the way exists
+	reverse[missSum[k] > 0] = math.inf
+	reverse[np.isnan(reverse)] = math.inf
+	forwardSkip[np.isnan(forwardSkip)] = math.inf
+	
+	best = int(np.argmin(reverse))
+	bestForward = int(np.argmin(forwardSkip))
+	if forwardSkip[bestForward] < reverse[best]:
+		if forwardSkip[bestForward] < 0:
+			return 'forward', (i + k[bestForward]) % n
+	elif reverse[best] < 0:
+		return 'reverse', (i + k[best]) % n
+	return None
+
+
+def reverseSegment(route, start, end):
+	# reverse route[start..end] of an index array in place. The stretch may wrap around the
+	# end of the array (end < start)
+	n = len(route)
+	start %= n
+	end %= n
+	if start <= end:
+		route[start:end+1] = route[start:end+1][::-1]
+	else:
+		stretch = np.arange(start, end + n + 1) % n
+		route[stretch] = route[stretch[::-1]]
+
+
+def rotateSegment(route, start, end):
+	# move route[end] up to start, and everything in route[start..end-1] one place later, in
+	# place. The stretch may wrap around the end of the array (end < start)
+	n = len(route)
+	start %= n
+	end %= n
+	if start <= end:
+		last = route[end]
+		route[start+1:end+1] = route[start:end]
+		route[start] = last
+	else:
+		stretch = np.arange(start, end + n + 1) % n
+		route[stretch] = np.roll(route[stretch], 1)
+
+
+def twoOpt(route, cost, deadline):
+	# 2-opt for asymmetric costs: keep applying the best reversal twoOptScan (in TSPKernels)
+	# finds until none improves. Returns the improved route and the number of moves applied.
+	route = np.array(route)
+	n = len(route)
+	moves = 0
+	while n > 3 and time.time() < deadline:
+		delta, i, j = TSPKernels.twoOptScan(route, cost)
+		if delta >= 0:
+			break
+		route[i+1:j+1] = route[i+1:j+1][::-1].copy()
+		moves += 1
+	return [int(c) for c in route], moves
+
+
+def publishBound(sharedBound, cost):
+	# lower the shared best cost (if there is one) to the cost given
+	if sharedBound is None:
+		return
+	with sharedBound.get_lock():
+		if cost < sharedBound.value:
+			sharedBound.value = cost
+
+
+# the best cost shared between the portfolio workers. It has to be handed over at pool creation
+_sharedBest = None
+
+def _portfolioInit(sharedBest):
+	global _sharedBest
+	_sharedBest = sharedBest
+
+
+def _portfolioWorker(name, scenario, time_allowance):
+	solver = TSPSolver(None)
+	solver.setupWithScenario(scenario)
+	if name == 'branchAndBound':
+		res = solver.branchAndBound(time_allowance, sharedBound=_sharedBest)
+	else:
+		res = getattr(solver, name)(time_allowance)
+	# City objects drag the whole scenario with them, so we send the route back as indices
+	route = None
+	if res is not None and res['soln'] is not None and res['cost'] < math.inf:
+		route = [city._index for city in res['soln'].route]
+		publishBound(_sharedBest, res['cost'])
+	cost = res['cost'] if route is not None else math.inf
+	return {'cost': cost, 'route': route, 'max': res.get('max') if res else None,
+			'total': res.get('total') if res else None, 'pruned': res.get('pruned') if res else None,
+			'optimal': res.get('optimal', False) if res else False}
+
+
+def kMeansClusters(xs, ys, k, rounds=8):
+	# split the cities into k spatial clusters with k-means (Lloyd's algorithm), started
+	# from k runs of the Hilbert order so that the centers are spread out to begin with.
+	# Returns a list of arrays of city indices (empty clusters are dropped)
+	n = len(xs)
+	k = min(k, n)
+	byCurve = np.argsort(hilbertIndex(xs, ys), kind='stable')
+	label = np.empty(n, dtype=np.int64)
+	label[byCurve] = np.arange(n) * k // n
+	for _ in range(rounds):
+		counts = np.bincount(label, minlength=k)
+		used = counts > 0
+		cx = np.bincount(label, weights=xs, minlength=k)[used] / counts[used]
+		cy = np.bincount(label, weights=ys, minlength=k)[used] / counts[used]
+		# nearest center of every city, a block of cities at a time to keep memory down
+		fresh = np.empty(n, dtype=np.int64)
+		step = max(1, 2**22 // len(cx))
+		for lo in range(0, n, step):
+			d = (xs[lo:lo+step, None] - cx[None, :])**2 + (ys[lo:lo+step, None] - cy[None, :])**2
+			fresh[lo:lo+step] = np.argmin(d, axis=1)
+		if np.array_equal(fresh, label):
+			break
+		label = fresh
+		k = len(cx)
+	byLabel = np.argsort(label, kind='stable')
+	bounds = np.searchsorted(label[byLabel], np.arange(k + 1))
+	return [byLabel[bounds[c]:bounds[c+1]] for c in range(k) if bounds[c] < bounds[c+1]]
+
+
+def coarseTour(cx, cy):
+	# an order to visit the cluster centers in: farthest insertion and or-opt over the
+	# distances between them (elevation is left out, it is small next to these)
+	cx = np.asarray(cx)
+	cy = np.asarray(cy)
+	if len(cx) < 3:
+		return list(range(len(cx)))
+	dist = np.sqrt((cx[:, None] - cx[None, :])**2 + (cy[:, None] - cy[None, :])**2)
+	np.fill_diagonal(dist, math.inf)
+	route = insertionTour(dist, True, math.inf)
+	route, _ = orOpt(route, dist, route, math.inf)
+	return route
+
+
+def borderEdges(scenario, clusters, candidates):
+	# for clusters in tour order, choose the edge from each cluster into the next one: the
+	# cheapest between the cities of each side nearest the other's center, or failing that
+	# between any of their cities. A cluster of two or more cities must be entered and left
+	# through different cities. Returns [(entry, exit)] as city indices for every cluster,
+	# or None if two neighboring clusters have no edge between them
+	xs, ys, _ = scenario._cityArrays()
+	count = len(clusters)
+	center = [(xs[c].mean(), ys[c].mean()) for c in clusters]
+	entries = [None] * count
+	exits = [None] * count
+	
+	def nearest(cluster, point, limit):
+		d = (xs[cluster] - point[0])**2 + (ys[cluster] - point[1])**2
+		return cluster[np.argsort(d, kind='stable')[:limit]]
+	
+	# the edge back to the first cluster goes last, when both of its ends are constrained
+	for k in list(range(1, count)) + [0]:
+		a = clusters[k-1]
+		b = clusters[k]
+		for limit in (candidates, None):
+			src = nearest(a, center[k], limit)
+			dst = nearest(b, center[k-1], limit)
+			block = scenario._costBlock(src, dst)
+			if len(a) > 1 and entries[k-1] is not None:
+				block[src == entries[k-1], :] = NO_EDGE
+			if len(b) > 1 and exits[k] is not None:
+				block[:, dst == exits[k]] = NO_EDGE
+			i, j = np.unravel_index(np.argmin(block), block.shape)
+			if block[i, j] != NO_EDGE:
+				exits[k-1] = int(src[i])
+				entries[k] = int(dst[j])
+				break
+		else:
+			return None
+	return list(zip(entries, exits))
+
+
+def pathTour(cost, first, last, start, deadline, hurry=1.0):
+	# a cheap path through all the cities of cost (a small int32 matrix) from first to last,
+	# as local indices, or a tour if first is None. The path is found as a tour in which
+	# the only way into first is from last, for free: then every tour is a path plus that
+	# edge, and the tour heuristics work unchanged. start is a route to improve on (made
+	# by farthest insertion, or the feasibility search, if None). If the deadline passes
+	# before either finds one, we settle for a nearest neighbor path, or for whatever the
+	# feasibility search finds in hurry more seconds. Returns the route (None on failure)
+	# and whether it had to be hurried like that
+	n = len(cost)
+	if first is not None and n > 1:
+		cost = np.array(cost)
+		cost[:, first] = NO_EDGE
+		cost[last, :] = NO_EDGE
+		cost[last, first] = 0
+	route = start
+	if route is None:
+		route = insertionTour(cost, True, deadline)
+	if route is None:
+		route = HamiltonSearch(cost != NO_EDGE, cost).run(deadline)
+	hurried = route is None and time.time() >= deadline
+	if hurried:
+		# starting from last, the free edge to first comes first, so nothing else can
+		# take first and the tour ends back at last
+		route = TSPKernels.nearestNeighborTour(cost, last if first is not None else 0)
+		route = [int(c) for c in route] if route is not None else None
+		if route is None:
+			route = HamiltonSearch(cost != NO_EDGE, cost).run(time.time() + hurry)
+	if route is None:
+		return None, hurried
+	route, _ = orOpt(route, cost, route, deadline)
+	if first is not None:
+		at = route.index(first)
+		route = route[at:] + route[:at]
+	return route, hurried
+
+
+# the scenario being decomposed, handed to the pool's workers when they start
+_decomposing = None
+
+def _decompositionInit(scenario):
+	global _decomposing
+	_decomposing = scenario
+
+
+def _pathWorker(task):
+	# solve one cluster (or seam window) for decomposition: members are the city indices,
+	# first and last the cities the path runs between (positions in members when start
+	# is given, city indices otherwise). Returns the path and whether it was hurried
+	members, first, last, start, deadline = task
+	members = np.asarray(members)
+	cost = _decomposing._costBlock(members, members)
+	if start is None and first is not None:
+		first = int(np.flatnonzero(members == first)[0])
+		last = int(np.flatnonzero(members == last)[0])
+	route, hurried = pathTour(cost, first, last, start, deadline)
+	return (members[route] if route is not None else None), hurried
+
+
+def shareMatrix(cost):
+	# put a cost matrix in shared memory for a pool's workers. Returns the SharedMemory (the
+	# caller closes and unlinks it) and what to hand the workers (see _multiStartInit).
+	# Anything but a numpy array (like SparseCosts, which is small anyway) is handed over
+	# as it is, with None for the SharedMemory
+	if not isinstance(cost, np.ndarray):
+		return None, cost
+	shared = shared_memory.SharedMemory(create=True, size=max(1, cost.nbytes))
+	np.ndarray(cost.shape, dtype=cost.dtype, buffer=shared.buf)[...] = cost
+	return shared, (shared.name, cost.shape, cost.dtype.str)
+
+
+# what the multi-start workers search with: the SharedMemory the matrix lives in (which
+# has to stay open while the matrix is used), the matrix and the candidate lists
+_multiStart = None
+
+def _multiStartInit(matrix, candidates):
+	global _multiStart
+	shared = None
+	if isinstance(matrix, tuple):
+		name, shape, dtype = matrix
+		shared = shared_memory.SharedMemory(name=name)
+		matrix = np.ndarray(shape, dtype=dtype, buffer=shared.buf)
+	_multiStart = (shared, matrix, candidates)
+
+
+def _multiStartWorker(task):
+	# the local search from one start of multiStart, given share seconds of its own
+	route, share, deadline, neighborhood, iterate = task
+	_, cost, candidates = _multiStart
+	began = time.time()
+	startCost = tourCost(cost, route)
+	route, moves, kicks, kept = localSearch(route, cost, min(deadline, began + share), neighborhood,
+											iterate, candidates)
+	route = [int(c) for c in route]
+	return {'route': route, 'startCost': startCost, 'cost': tourCost(cost, route), 'moves': moves,
+			'kicks': kicks, 'kept': kept, 'time': time.time() - began}
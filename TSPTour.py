@@ -0,0 +1,313 @@
+#!/usr/bin/python3
+
+''' <summary>
+	Tours that local search can make moves on: next, prev, between and flip, where
+	flip(a, b, c, d) swaps the tour edges a->b and c->d for a->c and b->d by turning the
+	path b..c around. ArrayTour keeps the tour as an array, the way fancy does, so a flip
+	costs as much as the path is long: O(n). TwoLevelTour keeps it as a two-level
+	doubly-linked list, so a flip is O(sqrt(n)). Run this file to compare the two.
+	</summary> '''
+
+import math
+import random
+import time
+import numpy as np
+
+
+''' <summary>
+	A tour as an array of cities in order, with the position of every city.
+	</summary> '''
+class ArrayTour:
+	def __init__( self, route ):
+		self.order = np.array( route )
+		self.pos = np.empty( len(route), dtype=np.int64 )
+		self.pos[self.order] = np.arange( len(route) )
+
+	def __len__( self ):
+		return len(self.order)
+
+	def next( self, c ):
+		return int( self.order[(self.pos[c] + 1) % len(self.order)] )
+
+	def prev( self, c ):
+		return int( self.order[self.pos[c] - 1] )
+
+	def between( self, a, b, c ):
+		# is b on the path from a forward to c?
+		i, j, k = self.pos[a], self.pos[b], self.pos[c]
+		if i <= k:
+			return i <= j <= k
+		return j >= i or j <= k
+
+	def flip( self, a, b, c, d ):
+		if self.next(a) != b or self.next(c) != d:
+			raise ValueError( 'flip needs the tour edges a->b and c->d' )
+		# turn the path b..c around in place (it may wrap around the end of the array)
+		n = len(self.order)
+		start, end = self.pos[b], self.pos[c]
+		stretch = np.arange( start, end + 1 if start <= end else end + n + 1 ) % n
+		self.order[stretch] = self.order[stretch[::-1]]
+		self.pos[self.order[stretch]] = stretch
+
+	def route( self ):
+		return [int(c) for c in self.order]
+
+
+''' <summary>
+	One segment of a TwoLevelTour: a run of cities kept as a list, which is read
+	backwards when reversed is set. rank orders the segments around the tour.
+	</summary> '''
+class Segment:
+	__slots__ = ( 'cities', 'reversed', 'next', 'prev', 'rank' )
+
+	def __init__( self, cities ):
+		self.cities = cities
+		self.reversed = False
+		self.next = None
+		self.prev = None
+		self.rank = 0
+
+	def first( self ):
+		return self.cities[-1] if self.reversed else self.cities[0]
+
+	def last( self ):
+		return self.cities[0] if self.reversed else self.cities[-1]
+
+
+''' <summary>
+	A tour as a two-level doubly-linked list (Fredman et al.): the tour is cut into about
+	sqrt(n) segments, which are linked in a ring and each carry a reversal bit. To turn
+	a path around, the segments at its ends are split so that the path is made of whole
+	segments, and then only the links and bits of those segments change, which is at
+	most sqrt(n) of them. The path or the rest of the tour is turned around, whichever
+	has fewer segments; turning the rest around leaves the tour running backwards, which
+	the flipped bit undoes. When splits have left too many segments the list is cut up
+	again, which is O(n) but only happens every sqrt(n) flips or so.
+	</summary> '''
+class TwoLevelTour:
+	RANK_STEP = 1 << 20 # gap left between the ranks of neighboring segments
+
+	def __init__( self, route ):
+		self.n = len(route)
+		self.groupSize = max( 1, int(math.sqrt(self.n)) )
+		self.seg = [None] * self.n
+		self.pos = [0] * self.n
+		self.flipped = False
+		self._build( [int(c) for c in route] )
+
+	def _build( self, route ):
+		segments = [Segment( route[i:i+self.groupSize] ) for i in range(0, self.n, self.groupSize)]
+		for k, s in enumerate( segments ):
+			s.next = segments[(k + 1) % len(segments)]
+			s.prev = segments[k - 1]
+			self._own( s )
+		self.head = segments[0]
+		self.count = len(segments)
+		self._rank()
+
+	def _rank( self ):
+		# number the segments from the head on, RANK_STEP apart
+		rank = 0
+		s = self.head
+		while True:
+			s.rank = rank
+			rank += self.RANK_STEP
+			s = s.next
+			if s is self.head:
+				break
+
+	def _own( self, s ):
+		# point the cities of s back at it
+		for i, c in enumerate( s.cities ):
+			self.seg[c] = s
+			self.pos[c] = i
+
+	def __len__( self ):
+		return self.n
+
+	def _next( self, c ):
+		# the next city going the way the segments are linked
+		s = self.seg[c]
+		i = self.pos[c] + (-1 if s.reversed else 1)
+		if 0 <= i < len(s.cities):
+			return s.cities[i]
+		return s.next.first()
+
+	def _prev( self, c ):
+		s = self.seg[c]
+		i = self.pos[c] + (1 if s.reversed else -1)
+		if 0 <= i < len(s.cities):
+			return s.cities[i]
+		return s.prev.last()
+
+	def next( self, c ):
+		return self._prev( c ) if self.flipped else self._next( c )
+
+	def prev( self, c ):
+		return self._next( c ) if self.flipped else self._prev( c )
+
+	def _key( self, c ):
+		s = self.seg[c]
+		return s.rank, len(s.cities) - 1 - self.pos[c] if s.reversed else self.pos[c]
+
+	def between( self, a, b, c ):
+		# is b on the path from a forward to c?
+		if self.flipped:
+			a, c = c, a
+		i, j, k = self._key( a ), self._key( b ), self._key( c )
+		if i <= k:
+			return i <= j <= k
+		return j >= i or j <= k
+
+	def flip( self, a, b, c, d ):
+		if self.next(a) != b or self.next(c) != d:
+			raise ValueError( 'flip needs the tour edges a->b and c->d' )
+		if self.flipped:
+			self._reverse( c, b )
+		else:
+			self._reverse( b, c )
+
+	def _reverse( self, b, c ):
+		# turn around the path from b to c (going the way the segments are linked)
+		if b == c:
+			return
+		if self._next( c ) == b:
+			self.flipped = not self.flipped # the whole tour
+			return
+		s = self.seg[b]
+		if s is self.seg[c] and self._key( b ) < self._key( c ):
+			# the path is inside one segment, so just turn that part of its list around
+			i, j = sorted( (self.pos[b], self.pos[c]) )
+			s.cities[i:j+1] = s.cities[i:j+1][::-1]
+			for k in range( i, j + 1 ):
+				self.pos[s.cities[k]] = k
+			return
+		self._splitBefore( b )
+		self._splitBefore( self._next(c) )
+		first, last = self.seg[b], self.seg[c]
+		run = 1
+		s = first
+		while s is not last:
+			s = s.next
+			run += 1
+		if 2 * run > self.count:
+			# the rest of the tour is shorter: turn it around, and the whole tour back
+			first, last = last.next, first.prev
+			self.flipped = not self.flipped
+		before = first.prev
+		last = self._reverseRun( first, last )
+		# glue small segments at the ends of the run back together
+		self._mergeNext( last )
+		self._mergeNext( before )
+		if self.count > 3 * self.groupSize:
+			self._build( self._rawRoute() )
+
+	def _splitBefore( self, c ):
+		# split the segment of c so that c is the first city of its segment. The new segment
+		# keeps the reversal bit, so only the cities whose place in a list moved are updated
+		s = self.seg[c]
+		if s.first() == c:
+			return
+		at = self.pos[c]
+		if s.reversed:
+			t = Segment( s.cities[:at+1] )
+			s.cities = s.cities[at+1:]
+			self._own( s )
+		else:
+			t = Segment( s.cities[at:] )
+			s.cities = s.cities[:at]
+			self._own( t )
+		for k in range( len(t.cities) ):
+			self.seg[t.cities[k]] = t
+		t.reversed = s.reversed
+		t.prev, t.next = s, s.next
+		s.next.prev = t
+		s.next = t
+		self.count += 1
+		# the ranks are spread out, so there is usually room for t between s and the next
+		following = t.next.rank if t.next is not self.head else s.rank + 2 * self.RANK_STEP
+		if following - s.rank > 1:
+			t.rank = (s.rank + following) // 2
+		else:
+			self._rank()
+
+	def _reverseRun( self, first, last ):
+		# turn around the segments from first to last, which are not the whole ring, and
+		# give back the segment that is at the end now
+		run = [first]
+		while run[-1] is not last:
+			run.append( run[-1].next )
+		before, after = first.prev, last.next
+		ranks = [s.rank for s in run]
+		run.reverse()
+		for k, s in enumerate( run ):
+			s.reversed = not s.reversed
+			s.rank = ranks[k]
+			s.prev = run[k-1] if k > 0 else before
+			s.next = run[k+1] if k + 1 < len(run) else after
+		before.next = run[0]
+		after.prev = run[-1]
+		# the ranks stayed where they were, so the head is still the lowest
+		if self.head in run:
+			self.head = min( run, key=lambda s: s.rank )
+		return run[-1]
+
+	def _mergeNext( self, s ):
+		# join s and the segment after it if they fit in one, in the orientation of s
+		t = s.next
+		if t is s or len(s.cities) + len(t.cities) > self.groupSize:
+			return
+		tail = t.cities if t.reversed == s.reversed else t.cities[::-1]
+		if s.reversed:
+			s.cities = tail + s.cities
+		else:
+			s.cities = s.cities + tail
+		self._own( s )
+		s.next = t.next
+		t.next.prev = s
+		self.count -= 1
+		if t is self.head:
+			self.head = s.next
+
+	def _rawRoute( self ):
+		route = []
+		s = self.head
+		while True:
+			route.extend( s.cities[::-1] if s.reversed else s.cities )
+			s = s.next
+			if s is self.head:
+				break
+		return route
+
+	def route( self ):
+		route = self._rawRoute()
+		return route[:1] + route[:0:-1] if self.flipped else route
+
+
+def benchmark( sizes=(1000, 10000, 100000), flips=2000, seed=312 ):
+	# time random flips on both tours, and check that they end up with the same tour
+	for n in sizes:
+		rng = random.Random( seed )
+		route = list( range(n) )
+		rng.shuffle( route )
+		moves = []
+		for _ in range( flips ):
+			moves.append( (rng.randrange(n), rng.randrange(n)) )
+		times = []
+		routes = []
+		for kind in (ArrayTour, TwoLevelTour):
+			tour = kind( route )
+			start = time.time()
+			for b, c in moves:
+				if b != c:
+					tour.flip( tour.prev(b), b, c, tour.next(c) )
+			times.append( (time.time() - start) / flips )
+			# from city 0, so that the two can be compared
+			end = tour.route()
+			routes.append( end[end.index(0):] + end[:end.index(0)] )
+		print( '{:>7} cities: array {:8.1f} us/flip, two-level {:8.1f} us/flip, same tour: {}'.format(
+			n, times[0] * 1e6, times[1] * 1e6, routes[0] == routes[1]) )
+
+
+if __name__ == '__main__':
+	benchmark()
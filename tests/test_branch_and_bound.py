@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+QtCore = pytest.importorskip('PyQt5.QtCore')
+
+import TSPSolver
+from TSPClasses import Scenario
+
+
+def makeSolver(ncities, seed=20):
+	random.seed(seed)
+	points = [QtCore.QPointF(-1.5 + 3 * random.random(), -1 + 2 * random.random()) for _ in range(ncities)]
+	solver = TSPSolver.TSPSolver(None)
+	solver.setupWithScenario(Scenario(points, 'Hard (Deterministic)', seed))
+	return solver
+
+
+def test_child_order_changes_the_order_depth_first_visits_children(monkeypatch):
+	solver = makeSolver(10)
+	root = solver.rootMatrix()
+	select = TSPSolver.WorkingCostMatrix.select
+	visits = {}
+	for order in ('column', 'regret'):
+		seen = []
+		def recording(self, nextCity, edgeCost=0):
+			# a child of the root is visited when its own children start being made
+			if len(self.path) == 2 and (len(seen) == 0 or seen[-1] != self.path[1]):
+				seen.append(int(self.path[1]))
+			select(self, nextCity, edgeCost)
+		monkeypatch.setattr(TSPSolver.WorkingCostMatrix, 'select', recording)
+		results = solver.branchAndBound(10, strategy='depth', childOrder=order, polish=False)
+		assert results['optimal']
+		# the children of the root are gone down in childOrder (less the ones that were pruned)
+		expected = TSPSolver.orderChildren(root.matrix, root.rowsAvailable, root.colsAvailable, 0, order)
+		assert seen == [c for c in expected if c in seen]
+		visits[order] = seen
+	assert visits['column'] != visits['regret']
@@ -0,0 +1,56 @@
+import random
+
+import numpy as np
+import pytest
+
+from TSPClasses import HashedEdges, Scenario, ScenarioDelta, SparseCosts, TSPSolution
+
+
+class Point:
+	# stands in for the GUI's QPointF
+	def __init__(self, x, y):
+		self._x, self._y = x, y
+
+	def x(self):
+		return self._x
+
+	def y(self):
+		return self._y
+
+
+def points(ncities, seed=7):
+	random.seed(seed)
+	return [Point(-1.5 + 3 * random.random(), -1 + 2 * random.random()) for _ in range(ncities)]
+
+
+def test_cost_of_routes_on_a_sparse_scenario():
+	ncities = 40
+	scenario = Scenario(points(ncities), 'Hard (Deterministic)', 7, fractionToRemove=0.95)
+	rng = np.random.default_rng(7)
+	routes = np.array([rng.permutation(ncities) for _ in range(5)])
+	# turn on the missing edges of the first route, so that one of them is a tour
+	missing = [(int(a), int(b)) for a, b in zip(routes[0], np.roll(routes[0], -1)) if not scenario._edge_exists[a, b]]
+	scenario.applyDelta(ScenarioDelta(toggledEdges=missing))
+	cost = scenario.getCostMatrix()
+	assert isinstance(cost, SparseCosts)
+
+	cities = scenario.getCities()
+	costs = TSPSolution.costOfRoutes(cost, routes)
+	assert list(costs) == [TSPSolution([cities[i] for i in route]).cost for route in routes]
+	assert costs[0] < np.inf
+
+
+def test_stand_in_matrices_end_like_arrays():
+	ncities = 30
+	sparse = Scenario(points(ncities), 'Hard (Deterministic)', 7, fractionToRemove=0.95)
+	hashed = Scenario(points(ncities), 'Hard (Deterministic)', 7, implicitEdges=True)
+	for matrix in (sparse.getCostMatrix(), sparse._edge_exists, hashed._edge_exists):
+		with pytest.raises(IndexError):
+			matrix[ncities]
+		with pytest.raises(IndexError):
+			matrix[0, -ncities - 1]
+		# which is what lets numpy read them row by row
+		dense = np.asarray(matrix)
+		assert dense.shape == (ncities, ncities)
+		assert np.array_equal(dense[3], matrix[3])
+	assert isinstance(hashed._edge_exists, HashedEdges)